@@ -0,0 +1,213 @@
+"""
+embeddings-service/common.py
+
+Helpers shared by main.py and dev_main.py.
+"""
+
+import os
+import math
+import queue
+import atexit
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+from threading import Thread, Event, Lock
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+import orjson
+import torch
+from fastapi.responses import Response
+
+log_listener = None
+
+
+def setup_logging():
+    """
+    Route log records through a queue: request handlers only enqueue them and a listener
+    thread does the stream writes, so a slow stderr never blocks the event loop.
+    """
+    global log_listener
+    if log_listener is not None:
+        return
+    log_queue = queue.Queue()
+    logging.basicConfig(level=logging.INFO, handlers=[QueueHandler(log_queue)])
+    log_listener = QueueListener(log_queue, logging.StreamHandler())
+    log_listener.start()
+    atexit.register(log_listener.stop)
+
+
+def hnsw_configuration() -> Dict[str, Any]:
+    """
+    HNSW index settings for the frame collection. Defaults favour recall over build time
+    (max_neighbors is HNSW's M); CHROMA_HNSW_M, CHROMA_EF_CONSTRUCTION and CHROMA_EF_SEARCH
+    override them. CHROMA_SPACE=ip makes new collections use inner product over L2-normalized
+    vectors, which ranks exactly like cosine (ChromaDB reports 1 - dot as the distance).
+    """
+    return {
+        "space": os.getenv("CHROMA_SPACE", "cosine"),
+        "max_neighbors": int(os.getenv("CHROMA_HNSW_M", "32")),
+        "ef_construction": int(os.getenv("CHROMA_EF_CONSTRUCTION", "400")),
+        "ef_search": int(os.getenv("CHROMA_EF_SEARCH", "100")),
+    }
+
+
+def collection_space(collection) -> Optional[str]:
+    """Distance function of a ChromaDB collection's HNSW index, if it reports one."""
+    configuration = getattr(collection, "configuration_json", None) or {}
+    return (configuration.get("hnsw") or {}).get("space") or (
+        collection.metadata or {}
+    ).get("hnsw:space")
+
+
+def normalize_embeddings(embeddings: np.ndarray) -> np.ndarray:
+    """L2-normalize each row so inner product equals cosine similarity."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    return embeddings / np.maximum(
+        np.linalg.norm(embeddings, axis=-1, keepdims=True), 1e-12
+    )
+
+
+def quantize_embeddings(embeddings: np.ndarray) -> np.ndarray:
+    """
+    Scale each embedding so its largest component is ±127 and round to int8 levels. Cosine
+    distance ignores per-vector scale, so nothing else needs storing; rounding moves cosine
+    distances by ~1e-5 while the JSON sent to ChromaDB is about half the size. ChromaDB still
+    stores float32, so the index doesn't shrink and this is opt-in via CHROMA_QUANTIZE_EMBEDDINGS=1.
+    """
+    scale = 127 / np.maximum(np.abs(embeddings).max(axis=1, keepdims=True), 1e-12)
+    # ChromaDB only accepts float embeddings, so keep the int8 levels as float32
+    return np.round(embeddings * scale).astype(np.float32)
+
+
+def prefetch(items: Iterator, depth: int, name: str) -> Iterator:
+    """
+    Produce `items` on a background thread, keeping up to `depth` of them queued so the
+    consumer doesn't wait on the producer while it still has work to do.
+    """
+    buffer = queue.Queue(maxsize=depth)
+    stop = Event()
+    done = object()
+
+    def put(entry) -> bool:
+        # give up once the consumer has gone away instead of blocking on a full queue forever
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put((item, None)):
+                    break
+            else:
+                put((done, None))
+        except Exception as e:
+            put((None, e))
+        finally:
+            if hasattr(items, "close"):
+                items.close()
+
+    Thread(target=produce, name=name, daemon=True).start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+# JPEGs of streamed frames are encoded and written here, so the CPU encode doesn't hold up
+# decoding and embedding the next frames
+frame_write_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="frame-writer")
+
+
+class FrameWriter:
+    """
+    Write the frames of one stream on frame_write_pool, with at most `max_pending` writes queued
+    so a slow disk applies backpressure instead of holding on to every decoded frame.
+    """
+
+    def __init__(self, max_pending: int = 8):
+        self.pending = deque()
+        self.max_pending = max_pending
+
+    def submit(self, fn, *args):
+        while len(self.pending) >= self.max_pending:
+            self.pending.popleft().result()
+        self.pending.append(frame_write_pool.submit(fn, *args))
+
+    def flush(self):
+        """Wait until every submitted write is on disk."""
+        while self.pending:
+            self.pending.popleft().result()
+
+
+# process-wide ring of pinned host buffers that frames and image batches are staged in before
+# the H2D copy; uploads larger than PINNED_STAGING_MAX_MB are copied from pageable memory instead,
+# so pinned memory stays under PINNED_RING_SIZE * PINNED_STAGING_MAX_MB however many threads upload
+PINNED_RING_SIZE = 4
+PINNED_STAGING_MAX_BYTES = int(os.getenv("PINNED_STAGING_MAX_MB", "32")) << 20
+pinned_ring = []
+pinned_ring_next = 0
+pinned_ring_lock = Lock()
+
+
+@contextmanager
+def staging_buffer(shape: Tuple[int, ...], dtype: torch.dtype = torch.uint8):
+    """
+    Lease the next slot of the pinned ring as a `shape`/`dtype` view, once its previous upload
+    has finished, yielding (buffer, event). Record the upload on the event before the block exits;
+    the slot is reserved until then. Yields (None, None) for uploads too large to stage.
+    """
+    global pinned_ring_next
+    nbytes = math.prod(shape) * dtype.itemsize
+    if nbytes > PINNED_STAGING_MAX_BYTES:
+        yield None, None
+        return
+    with pinned_ring_lock:
+        if not pinned_ring:
+            pinned_ring.extend(
+                [Lock(), torch.empty(0, dtype=torch.uint8), torch.cuda.Event()]
+                for _ in range(PINNED_RING_SIZE)
+            )
+        slot = pinned_ring[pinned_ring_next]
+        pinned_ring_next = (pinned_ring_next + 1) % PINNED_RING_SIZE
+    slot_lock, buffer, copied = slot
+    with slot_lock:
+        copied.synchronize()
+        # buffers grow to the largest upload seen, up to PINNED_STAGING_MAX_BYTES
+        if buffer.numel() < nbytes:
+            buffer = slot[1] = torch.empty(nbytes, dtype=torch.uint8, pin_memory=True)
+        yield buffer[:nbytes].view(dtype).view(shape), copied
+
+
+# liveness probes poll /health constantly; once the model is loaded the body never changes
+health_body = None
+
+
+def health_response(model_loaded: bool, device) -> Response:
+    """/health response, serialized once and reused after the model has loaded."""
+    global health_body
+    if health_body is None:
+        body = orjson.dumps(
+            {
+                "status": "healthy",
+                "model_loaded": model_loaded,
+                "device": str(device) if device else None,
+            }
+        )
+        if not model_loaded:
+            return Response(content=body, media_type="application/json")
+        health_body = body
+    return Response(content=health_body, media_type="application/json")
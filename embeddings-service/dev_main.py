@@ -7,31 +7,52 @@ Provides endpoints for single image and batch embedding generation.
 
 import os
 import io
+import math
+import functools
+import itertools
 import logging
+import asyncio
+import time
 import tempfile
-from typing import List, Dict, Any
+import mmap
+from typing import List, Dict, Any, Optional, Tuple, Literal
+import numpy as np
 import torch
+import torch.nn.functional as F
 import open_clip
 from PIL import Image
 import cv2
-from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks
+from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks, Query
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import uvicorn
 import chromadb
 import uuid
 from datetime import datetime
-from threading import Lock
+from threading import Lock, local
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import glob
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, Response
 import subprocess
 import json
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
+from common import (
+    setup_logging,
+    hnsw_configuration,
+    collection_space,
+    normalize_embeddings,
+    quantize_embeddings,
+    prefetch,
+    health_response,
+    staging_buffer,
+    FrameWriter,
+)
 
 load_dotenv()
 
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 print("[LOG] main.py module imported (process startup)")
@@ -62,6 +83,8 @@ app = FastAPI(
     title="Movie Video Archive - Embeddings Service",
     description="Microservice for generating image embeddings using OpenCLIP for movies",
     version="1.0.0",
+    # orjson serializes the 512-float embedding lists (and numpy arrays) far faster than stdlib json
+    default_response_class=ORJSONResponse,
 )
 
 logger.info("[LOG] FastAPI app instance created")
@@ -77,6 +100,22 @@ app.add_middleware(
 model = None
 preprocess = None
 device = None
+model_dtype = torch.float32
+onnx_session = None
+clip_mean = None
+clip_std = None
+visual_compiled = False
+# batch size -> (CUDA graph, static input, static output) for the eager image tower
+cuda_graphs = {}
+cuda_graph_lock = Lock()
+# PyTurboJPEG decoder, False once it turned out to be unavailable
+turbo_jpeg = None
+# frame uploads run here so they overlap with the image tower on the default stream
+copy_stream = None
+
+# batch sizes the compiled or graph-captured image tower is specialized for;
+# smaller batches are zero-padded up
+BATCH_BUCKETS = (1, 16, 64, 128)
 
 chroma_client = None
 collection = None
@@ -84,6 +123,66 @@ collection = None
 job_status = {}
 job_status_lock = Lock()
 
+# ChromaDB writes run here so a job can encode its next batch during the round-trip
+upsert_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chroma-upsert")
+
+# every image-tower forward pass runs on this one thread (see encode_image_rows): the CUDA
+# graphs torch.compile records are kept per thread, so only this thread's get warmed up and reused
+inference_thread = local()
+inference_executor = ThreadPoolExecutor(
+    max_workers=1,
+    thread_name_prefix="inference",
+    initializer=lambda: setattr(inference_thread, "active", True),
+)
+UPSERT_MAX_PENDING = 4
+
+
+class EmbeddingCache:
+    """Thread-safe LRU of debug embeddings keyed by (path, mtime, size), with hit-rate stats."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            embedding = self.entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, key, embedding):
+        with self.lock:
+            self.entries[key] = embedding
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+debug_embedding_cache = EmbeddingCache(
+    int(os.getenv("DEBUG_EMBEDDING_CACHE_SIZE", "1024"))
+)
+
 
 class EmbeddingRequest(BaseModel):
     image_paths: List[str]
@@ -122,9 +221,14 @@ class VideoProcessingResponse(BaseModel):
     model_info: Dict[str, Any]
 
 
+class DebugEmbeddingsRequest(BaseModel):
+    paths: List[str]
+
+
 def load_model():
     """Load OpenCLIP model and preprocessor."""
-    global model, preprocess, device
+    global model, preprocess, device, model_dtype, onnx_session, clip_mean, clip_std
+    global visual_compiled, cuda_graphs, copy_stream
 
     if model is None:
         logger.info("🤖 Loading OpenCLIP model...")
@@ -135,12 +239,223 @@ def load_model():
         model, _, preprocess = open_clip.create_model_and_transforms(
             model_name="ViT-B-32", pretrained="openai", device=device
         )
+        model.eval()
+        # grad mode is per thread, so freezing the weights also covers encodes on executor threads
+        model.requires_grad_(False)
+        clip_mean = torch.tensor(open_clip.OPENAI_DATASET_MEAN, device=device).view(
+            3, 1, 1
+        )
+        clip_std = torch.tensor(open_clip.OPENAI_DATASET_STD, device=device).view(
+            3, 1, 1
+        )
+
+        # export while the model is still FP32 so the ONNX graph takes plain float32 input
+        onnx_path = os.getenv("CLIP_ONNX_PATH")
+        if onnx_path:
+            onnx_session = load_onnx_visual(onnx_path)
+
+        # FP16 halves memory traffic through the ViT on GPU; CPU stays in FP32 where half is slow
+        if device.type == "cuda" and os.getenv("CLIP_FP16", "1") == "1":
+            model = model.half()
+            model_dtype = torch.float16
+
+        # NHWC lets the patch-embedding conv use Tensor Core kernels; inputs are converted to match
+        if device.type == "cuda":
+            model.visual = model.visual.to(memory_format=torch.channels_last)
+
+        if device.type == "cuda":
+            copy_stream = torch.cuda.Stream(device=device)
+
+        # FP8 matmuls need an FP8-capable GPU (Ada/Hopper, sm_89+); everything else keeps FP16
+        if (
+            device.type == "cuda"
+            and os.getenv("CLIP_FP8") == "1"
+            and torch.cuda.get_device_capability(device) >= (8, 9)
+        ):
+            quantize_visual_fp8()
+
+        # inputs are always 3x224x224 and batches are padded to BATCH_BUCKETS, so
+        # Inductor can autotune kernels for a few static shapes
+        if (
+            device.type == "cuda"
+            and hasattr(torch, "compile")
+            and os.getenv("CLIP_COMPILE", "1") == "1"
+        ):
+            eager_visual = model.visual
+            try:
+                logger.info("⚙️  Compiling OpenCLIP image encoder...")
+                model.visual = torch.compile(
+                    eager_visual,
+                    mode=os.getenv("CLIP_COMPILE_MODE", "max-autotune"),
+                    dynamic=False,
+                )
+                # pay the compile and autotune cost for every bucket now rather than on requests,
+                # on the inference thread that will replay the recorded CUDA graphs
+                for bucket in BATCH_BUCKETS:
+                    encode_image_rows(torch.zeros(bucket, 3, 224, 224))
+                visual_compiled = True
+            except Exception as e:
+                logger.warning(
+                    f"⚠️  torch.compile failed, using eager image encoder: {e}"
+                )
+                model.visual = eager_visual
+
+        # compiled modes already replay CUDA graphs; the eager tower gets hand-captured ones
+        if (
+            device.type == "cuda"
+            and not visual_compiled
+            and os.getenv("CLIP_CUDA_GRAPHS", "1") == "1"
+        ):
+            try:
+                cuda_graphs = capture_cuda_graphs()
+                logger.info(f"📸 Captured CUDA graphs for batch sizes {BATCH_BUCKETS}")
+            except Exception as e:
+                logger.warning(f"⚠️  CUDA graph capture failed, running eagerly: {e}")
+                cuda_graphs = {}
 
-        logger.info("✅ OpenCLIP model loaded successfully")
+        logger.info(f"✅ OpenCLIP model loaded successfully ({model_dtype})")
 
     return model, preprocess
 
 
+def quantize_visual_fp8():
+    """
+    Quantize the MLP Linears of the image encoder to row-wise FP8 with torchao.
+    The first and last transformer blocks and the attention projections stay in BF16.
+    """
+    global model, model_dtype
+
+    try:
+        from torchao.quantization import (
+            Float8DynamicActivationFloat8WeightConfig,
+            PerRow,
+            quantize_,
+        )
+    except ImportError:
+        logger.warning(
+            "⚠️  torchao is not installed, keeping unquantized image encoder"
+        )
+        return
+
+    last_block = len(model.visual.transformer.resblocks) - 1
+
+    def is_quantized_linear(module, fqn: str) -> bool:
+        # fqn looks like "transformer.resblocks.3.mlp.c_fc"
+        parts = fqn.split(".")
+        return (
+            isinstance(module, torch.nn.Linear)
+            and parts[:2] == ["transformer", "resblocks"]
+            and parts[3] == "mlp"
+            and int(parts[2]) not in (0, last_block)
+        )
+
+    previous_dtype = model_dtype
+    try:
+        # row-wise scaled FP8 matmuls produce BF16
+        model = model.to(torch.bfloat16)
+        quantize_(
+            model.visual,
+            Float8DynamicActivationFloat8WeightConfig(granularity=PerRow()),
+            filter_fn=is_quantized_linear,
+        )
+        model_dtype = torch.bfloat16
+        logger.info("✅ Quantized image encoder MLPs to FP8")
+    except Exception as e:
+        logger.warning(
+            f"⚠️  FP8 quantization failed, keeping unquantized image encoder: {e}"
+        )
+        model = model.to(previous_dtype)
+        model_dtype = previous_dtype
+
+
+def capture_cuda_graphs():
+    """
+    Capture model.encode_image as one CUDA graph per batch bucket, so a forward pass is a
+    single graph launch instead of hundreds of small kernel launches.
+    """
+    graphs = {}
+    side_stream = torch.cuda.Stream(device=device)
+    # replays are serialized by cuda_graph_lock, so all graphs can share one memory pool;
+    # capturing the largest bucket first lets the smaller ones fit in its activations
+    pool = None
+    for bucket in sorted(BATCH_BUCKETS, reverse=True):
+        static_input = torch.zeros(
+            bucket, 3, 224, 224, device=device, dtype=model_dtype
+        ).contiguous(memory_format=torch.channels_last)
+        # autocast's weight cache can't live inside a captured graph
+        with torch.inference_mode(), autocast_context(cache_enabled=False):
+            # warm up on a side stream so lazy initialization stays out of the capture
+            side_stream.wait_stream(torch.cuda.current_stream(device))
+            with torch.cuda.stream(side_stream):
+                for _ in range(3):
+                    model.encode_image(static_input)
+            torch.cuda.current_stream(device).wait_stream(side_stream)
+
+            graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(graph, pool=pool):
+                static_output = model.encode_image(static_input)
+        pool = graph.pool()
+        graphs[bucket] = (graph, static_input, static_output)
+    return graphs
+
+
+def load_onnx_visual(visual_path: str):
+    """
+    Load the CLIP image encoder as an ONNX Runtime session, exporting it to `visual_path`
+    first if the file doesn't exist. Returns None if ONNX Runtime or the export is unavailable.
+    """
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        logger.warning("⚠️  onnxruntime is not installed, using PyTorch image encoder")
+        return None
+
+    try:
+        if not os.path.exists(visual_path):
+            logger.info(f"📦 Exporting CLIP image encoder to ONNX: {visual_path}")
+            torch.onnx.export(
+                model.visual,
+                torch.zeros(1, 3, 224, 224, device=device),
+                visual_path,
+                input_names=["image"],
+                output_names=["embedding"],
+                dynamic_axes={"image": {0: "batch"}, "embedding": {0: "batch"}},
+                opset_version=17,
+                dynamo=False,
+            )
+        available = ort.get_available_providers()
+        providers = [
+            provider
+            for provider in ("CUDAExecutionProvider", "CPUExecutionProvider")
+            if provider in available
+        ]
+        if "TensorrtExecutionProvider" in available:
+            # FP16 engine with a batch profile covering single images up to job patch chunks,
+            # cached next to the ONNX file so it is only built once
+            providers.insert(
+                0,
+                (
+                    "TensorrtExecutionProvider",
+                    {
+                        "trt_fp16_enable": True,
+                        "trt_engine_cache_enable": True,
+                        "trt_engine_cache_path": os.path.dirname(
+                            os.path.abspath(visual_path)
+                        ),
+                        "trt_profile_min_shapes": "image:1x3x224x224",
+                        "trt_profile_opt_shapes": "image:64x3x224x224",
+                        "trt_profile_max_shapes": "image:256x3x224x224",
+                    },
+                ),
+            )
+        session = ort.InferenceSession(visual_path, providers=providers)
+        logger.info(f"✅ Loaded ONNX image encoder ({session.get_providers()[0]})")
+        return session
+    except Exception as e:
+        logger.warning(f"⚠️  Could not load ONNX image encoder, using PyTorch: {e}")
+        return None
+
+
 def init_chroma_db():
     """Initialize ChromaDB client and collection."""
     global chroma_client, collection
@@ -168,13 +483,28 @@ def init_chroma_db():
                 name="movie_video_embeddings",
                 metadata={"description": "Movie video frame embeddings"},
                 embedding_function=None,
-                configuration={
-                    "hnsw": {
-                        "space": "cosine",
-                    }
-                },
+                configuration={"hnsw": hnsw_configuration()},
             )
-            logger.info("✅ Created new ChromaDB collection with cosine metric")
+            logger.info(
+                f"✅ Created new ChromaDB collection with {collection_space(collection)} metric"
+            )
+        else:
+            # a collection's metric is fixed; drop it and re-run the jobs to move to CHROMA_SPACE
+            space = os.getenv("CHROMA_SPACE")
+            if space and collection_space(collection) not in (None, space):
+                logger.warning(
+                    f"⚠️  Collection uses {collection_space(collection)}, not CHROMA_SPACE={space}; recreate it to migrate"
+                )
+            # M and ef_construction are fixed at creation, but ef_search can be changed in place
+            if os.getenv("CHROMA_EF_SEARCH"):
+                try:
+                    collection.modify(
+                        configuration={
+                            "hnsw": {"ef_search": int(os.getenv("CHROMA_EF_SEARCH"))}
+                        }
+                    )
+                except Exception as e:
+                    logger.warning(f"⚠️  Could not update ef_search: {e}")
     return chroma_client, collection
 
 
@@ -182,8 +512,12 @@ chroma_client_test, collection_test = init_chroma_db()
 print("[DEBUG] init_chroma_db() returned:", chroma_client_test, collection_test)
 
 
-def generate_patch_configs(width: int, height: int):
-    """Generate full image, 4 quadrants, and split each quadrant vertically (13 patches total)."""
+@functools.lru_cache(maxsize=16)
+def generate_patch_configs(width: int, height: int) -> Tuple[Dict[str, Any], ...]:
+    """
+    Generate full image, 4 quadrants, and split each quadrant vertically (13 patches total).
+    Cached per resolution since every frame of a movie shares it; treat the result as read-only.
+    """
     mid_x = width // 2
     mid_y = height // 2
 
@@ -238,11 +572,24 @@ def generate_patch_configs(width: int, height: int):
             }
         )
 
-    return patches + quadrants + sub_quadrants
+    return tuple(patches + quadrants + sub_quadrants)
 
 
 def detect_video_codec(video_path: str) -> str:
-    """Detect the video codec using ffprobe."""
+    """Detect the video codec from the container header with PyAV if installed, else with ffprobe."""
+    # reading the header in-process avoids an ffprobe fork+exec per video
+    try:
+        import av
+
+        with av.open(video_path) as container:
+            return container.streams.video[0].codec_context.name
+    except ImportError:
+        pass
+    except Exception as e:
+        logger.warning(
+            f"[PyAV] Could not detect codec for {video_path}, trying ffprobe: {e}"
+        )
+
     cmd = [
         "ffprobe",
         "-v",
@@ -297,14 +644,130 @@ def extract_every_nth_frame_ffmpeg(
             ts = int(os.path.splitext(fname)[0].replace("frame_", ""))
         except Exception:
             ts = idx * n
+        frames.append(
+            {
+                "path": os.path.join(output_dir, fname),
+                "timestamp": ts,
+                "frame_number": idx,
+            }
+        )
+    logger.info(f"[FFMPEG] Extracted {len(frames)} frames from {video_path}")
+    return frames
+
+
+def probe_video_stream(video_path: str) -> Dict[str, int]:
+    """Read width, height and frame count of the first video stream using ffprobe."""
+    cmd = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-show_entries",
+        "stream=width,height,nb_frames",
+        "-of",
+        "json",
+        video_path,
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    stream = json.loads(result.stdout)["streams"][0]
+    nb_frames = stream.get("nb_frames", "")
+    return {
+        "width": int(stream["width"]),
+        "height": int(stream["height"]),
+        "nb_frames": int(nb_frames) if nb_frames.isdigit() else 0,
+    }
+
+
+def stream_every_nth_frame_ffmpeg(video_path: str, output_dir: str, n: int = 5):
+    """
+    Yield every Nth frame as a BGR ndarray read from an ffmpeg rawvideo pipe.
+    Frames are embedded from memory; the JPEG in output_dir is only written for framePath consumers,
+    in the background, and every write has finished once the stream is exhausted.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    info = probe_video_stream(video_path)
+    width, height = info["width"], info["height"]
+    frame_size = width * height * 3
+    cmd = [
+        "ffmpeg",
+        "-v",
+        "error",
+        "-i",
+        video_path,
+        "-vf",
+        f"select='not(mod(n\\,{n}))',scale={width}:{height}",
+        "-vsync",
+        "0",
+        "-f",
+        "rawvideo",
+        "-pix_fmt",
+        "bgr24",
+        "pipe:1",
+    ]
+    logger.info(
+        f"[FFMPEG] Streaming every {n}th frame from {video_path} ({width}x{height})"
+    )
+    writer = FrameWriter()
+    idx = 0
+    # 1 MiB pipe buffer so each frame is a few large reads rather than many small syscalls
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=1 << 20) as proc:
+        while True:
+            buf = proc.stdout.read(frame_size)
+            if len(buf) < frame_size:
+                break
+            frame = np.frombuffer(buf, np.uint8).reshape(height, width, 3)
+            frame_path = os.path.join(output_dir, f"frame_{idx + 1:06d}.jpg")
+            writer.submit(cv2.imwrite, frame_path, frame)
+            yield {
+                "path": frame_path,
+                "timestamp": idx + 1,
+                "frame_number": idx * n,
+                "frame": frame,
+            }
+            idx += 1
+        proc.stdout.close()
+        returncode = proc.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd)
+    writer.flush()
+    logger.info(f"[FFMPEG] Streamed {idx} frames from {video_path}")
+
+
+def extract_every_nth_frame_video_reader(
+    video_path: str, output_dir: str, n: int = 5
+) -> list:
+    """
+    Extract every Nth frame in-process with video-reader-rs (FFmpeg bindings, hardware decode
+    on GPU hosts). Frames already on disk are not re-encoded. Returns list of frame info dicts.
+    """
+    from video_reader import PyVideoReader
+
+    os.makedirs(output_dir, exist_ok=True)
+    reader = PyVideoReader(
+        video_path, threads=0, device="cuda" if torch.cuda.is_available() else "cpu"
+    )
+    num_frames = reader.get_shape()[0]
+    indices = list(range(0, num_frames, n))
+    logger.info(
+        f"[VIDEO_READER] Extracting every {n}th frame from {video_path} ({len(indices)} frames)"
+    )
+    frames = []
+    for start in range(0, len(indices), 32):
+        chunk = indices[start : start + 32]
+        batch = None
+        for offset, frame_number in enumerate(chunk):
+            idx = start + offset
+            frame_path = os.path.join(output_dir, f"frame_{idx + 1:06d}.jpg")
+            if not os.path.exists(frame_path):
+                # decode the chunk lazily, only once a frame is missing from the cache
+                if batch is None:
+                    batch = reader.get_batch(chunk)
+                cv2.imwrite(frame_path, cv2.cvtColor(batch[offset], cv2.COLOR_RGB2BGR))
             frames.append(
-                {
-                    "path": os.path.join(output_dir, fname),
-                    "timestamp": ts,
-                    "frame_number": idx,
-                }
+                {"path": frame_path, "timestamp": idx + 1, "frame_number": frame_number}
             )
-    logger.info(f"[FFMPEG] Extracted {len(frames)} frames from {video_path}")
+    logger.info(f"[VIDEO_READER] Extracted {len(frames)} frames from {video_path}")
     return frames
 
 
@@ -312,53 +775,245 @@ def extract_frames_from_video(
     video_path: str, output_dir: str, frame_interval: int = 5
 ) -> list:
     """
-    Extract frames from video at specified intervals using ffmpeg+NVDEC for maximum performance.
+    Extract frames from video at specified intervals, in-process with video-reader-rs when
+    it is installed and with the ffmpeg CLI otherwise or if it fails.
     Returns a list of dicts: {path, timestamp, frame_number}
     """
+    try:
+        return extract_every_nth_frame_video_reader(
+            video_path, output_dir, n=frame_interval
+        )
+    except ImportError:
+        pass
+    except Exception as e:
+        logger.warning(
+            f"[VIDEO_READER] Decode failed for {video_path} "
+            f"({detect_video_codec(video_path)}), falling back to ffmpeg: {e}"
+        )
     return extract_every_nth_frame_ffmpeg(video_path, output_dir, n=frame_interval)
 
 
+def read_frame(frame_path: str) -> Optional[np.ndarray]:
+    """
+    Decode a frame into a BGR uint8 array, or None if it can't be read. JPEGs go through
+    libjpeg-turbo's SIMD decoder via PyTurboJPEG when it is installed, falling back to
+    OpenCV for anything it can't decode.
+    """
+    global turbo_jpeg
+    if frame_path.lower().endswith((".jpg", ".jpeg")):
+        if turbo_jpeg is None:
+            try:
+                from turbojpeg import TurboJPEG
+
+                turbo_jpeg = TurboJPEG()
+            except (ImportError, OSError, RuntimeError):
+                turbo_jpeg = False
+        if turbo_jpeg:
+            try:
+                # decode straight from the page cache instead of copying into a bytes object
+                with open(frame_path, "rb") as f, mmap.mmap(
+                    f.fileno(), 0, access=mmap.ACCESS_READ
+                ) as mm:
+                    try:
+                        return turbo_jpeg.decode(mm)
+                    except Exception:
+                        # handled here so the traceback, which still holds decode()'s
+                        # view of the mapping, is dropped before the mmap is closed
+                        pass
+            except Exception:
+                pass
+    # extracted frames carry no EXIF orientation, so skip parsing it
+    return cv2.imread(frame_path, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+
+
+def tensor_to_device(
+    tensor: torch.Tensor, dtype: Optional[torch.dtype] = None
+) -> torch.Tensor:
+    """Upload a CPU tensor to `device` (cast to `dtype`), via pinned memory and copy_stream on GPU."""
+    if device.type != "cuda":
+        return tensor if dtype is None else tensor.to(dtype)
+
+    # a pageable source makes the copy synchronous; staging it in pinned memory makes it a real async DMA
+    with staging_buffer(tuple(tensor.shape), tensor.dtype) as (staging, copied):
+        if staging is None:
+            return tensor.to(device, dtype=dtype)
+        staging.copy_(tensor)
+        with torch.cuda.stream(copy_stream):
+            tensor = staging.to(device, dtype=dtype, non_blocking=True)
+            copied.record(copy_stream)
+    # the default stream only waits for this copy, not for everything on copy_stream
+    compute_stream = torch.cuda.current_stream(device)
+    compute_stream.wait_event(copied)
+    tensor.record_stream(compute_stream)
+    return tensor
+
+
+def frame_to_device(frame: np.ndarray) -> torch.Tensor:
+    """Upload a (H, W, 3) uint8 frame to `device`, via pinned memory and copy_stream on GPU."""
+    return tensor_to_device(torch.from_numpy(frame))
+
+
+def preprocess_frame_patches(frame: np.ndarray, patch_configs) -> torch.Tensor:
+    """
+    Crop, resize and normalize every patch of a BGR frame into one (N, 3, 224, 224) batch.
+    Mirrors the CLIP preprocess (shortest side to 224, center crop, normalize) on the
+    uploaded frame instead of running PIL once per patch.
+    """
+    # one upload per frame; the BGR->RGB flip is a channel index on device
+    frame_t = frame_to_device(frame)
+    frame_t = frame_t.permute(2, 0, 1)[[2, 1, 0]].float().div_(255)
+
+    patches = []
+    for config in patch_configs:
+        x, y, w, h = config["x"], config["y"], config["width"], config["height"]
+        if w <= h:
+            new_w, new_h = 224, int(224 * h / w)
+        else:
+            new_w, new_h = int(224 * w / h), 224
+        patch = F.interpolate(
+            frame_t[None, :, y : y + h, x : x + w],
+            size=(new_h, new_w),
+            mode="bicubic",
+            align_corners=False,
+            antialias=True,
+        )
+        top = int(round((new_h - 224) / 2.0))
+        left = int(round((new_w - 224) / 2.0))
+        patches.append(patch[0, :, top : top + 224, left : left + 224])
+
+    batch = torch.stack(patches).clamp_(0, 1)
+    return batch.sub_(clip_mean).div_(clip_std)
+
+
+def autocast_context(cache_enabled: bool = True):
+    """
+    FP16 autocast on GPU, keeping LayerNorm and softmax in FP32, or BF16 once the encoder
+    has been converted for FP8. On CPU, CLIP_CPU_BF16=1 enables BF16 autocast, which pays
+    off only on CPUs with native BF16 (AVX512-BF16/AMX).
+    """
+    if device.type == "cuda":
+        # the FP8 linears take and return BF16, so FP16-cast activations would mix dtypes
+        dtype = torch.bfloat16 if model_dtype == torch.bfloat16 else torch.float16
+        return torch.autocast(
+            device_type="cuda", dtype=dtype, cache_enabled=cache_enabled
+        )
+    return torch.autocast(
+        device_type="cpu",
+        dtype=torch.bfloat16,
+        enabled=os.getenv("CLIP_CPU_BF16") == "1",
+        cache_enabled=cache_enabled,
+    )
+
+
+def pad_to_bucket(image_batch: torch.Tensor) -> torch.Tensor:
+    """Zero-pad a batch up to the next BATCH_BUCKETS size when the image tower is compiled or captured."""
+    size = len(image_batch)
+    bucket = next((b for b in BATCH_BUCKETS if b >= size), size)
+    if not (visual_compiled or cuda_graphs) or bucket == size:
+        return image_batch
+    padding = image_batch.new_zeros((bucket - size, *image_batch.shape[1:]))
+    return torch.cat([image_batch, padding])
+
+
+def model_input(image_batch: torch.Tensor) -> torch.Tensor:
+    """
+    Move a (N, 3, 224, 224) batch to the model's device and dtype, padded to a compile
+    bucket and channels_last on GPU. Callers keep the first N output rows.
+    """
+    image_batch = pad_to_bucket(
+        image_batch.to(device, dtype=model_dtype, non_blocking=True)
+    )
+    if device.type == "cuda":
+        image_batch = image_batch.contiguous(memory_format=torch.channels_last)
+    return image_batch
+
+
+def encode_image_rows(image_batch: torch.Tensor) -> np.ndarray:
+    """
+    Encode a (N, 3, 224, 224) batch into N float32 rows, replaying a captured CUDA graph if one
+    fits. Calls from other threads wait for the encode to run on the inference thread.
+    """
+    if not getattr(inference_thread, "active", False):
+        return inference_executor.submit(encode_image_rows, image_batch).result()
+    size = len(image_batch)
+    captured = cuda_graphs.get(next((b for b in BATCH_BUCKETS if b >= size), None))
+    with torch.inference_mode(), autocast_context():
+        if captured is None:
+            image_features = model.encode_image(model_input(image_batch))
+            return image_features[:size].float().cpu().numpy()
+        # the static buffers are shared, so replays from request threads and jobs take turns
+        graph, static_input, static_output = captured
+        with cuda_graph_lock:
+            # the static input is a preallocated device buffer: copy, cast and reformat the rows
+            # straight into it instead of building a padded channels_last batch first. Rows past
+            # `size` keep stale inputs, which only affect the output rows that are dropped
+            static_input[:size].copy_(image_batch, non_blocking=True)
+            graph.replay()
+            return static_output[:size].float().cpu().numpy()
+
+
+def run_onnx_visual(image_batch: torch.Tensor) -> np.ndarray:
+    """
+    Run the ONNX image encoder on a (N, 3, 224, 224) batch into float32 rows. A CUDA batch is
+    bound in place with IO binding, so a GPU execution provider reads it without a round trip
+    through host memory.
+    """
+    if (
+        image_batch.device.type != "cuda"
+        or onnx_session.get_providers()[0] == "CPUExecutionProvider"
+    ):
+        image_features = onnx_session.run(None, {"image": image_batch.cpu().numpy()})[0]
+        return image_features.astype(np.float32)
+
+    image_batch = image_batch.float().contiguous()
+    binding = onnx_session.io_binding()
+    binding.bind_input(
+        "image",
+        "cuda",
+        image_batch.device.index or 0,
+        np.float32,
+        tuple(image_batch.shape),
+        image_batch.data_ptr(),
+    )
+    binding.bind_output("embedding", "cpu")
+    # ONNX Runtime reads the buffer on its own stream, after the preprocess kernels are done
+    torch.cuda.current_stream(image_batch.device).synchronize()
+    onnx_session.run_with_iobinding(binding)
+    return binding.copy_outputs_to_cpu()[0].astype(np.float32)
+
+
+def encode_patch_batch(patch_batch: torch.Tensor) -> np.ndarray:
+    """Encode a (N, 3, 224, 224) patch batch in a single forward pass into float32 rows."""
+    if onnx_session is not None:
+        return run_onnx_visual(patch_batch)
+    return encode_image_rows(patch_batch)
+
+
 def generate_patch_embeddings(
     frame_path: str, model, preprocess, device
 ) -> List[FramePatch]:
     """Generate embeddings for all patches of a frame."""
-    frame = cv2.imread(frame_path)
+    frame = read_frame(frame_path)
     if frame is None:
         raise ValueError(f"Could not load frame: {frame_path}")
 
     height, width = frame.shape[:2]
     patch_configs = generate_patch_configs(width, height)
 
-    patches = []
-    for config in patch_configs:
-        try:
-            x, y, w, h = config["x"], config["y"], config["width"], config["height"]
-            patch = frame[y : y + h, x : x + w]
-
-            patch_rgb = cv2.cvtColor(patch, cv2.COLOR_BGR2RGB)
-            pil_patch = Image.fromarray(patch_rgb)
-
-            image_tensor = preprocess(pil_patch).unsqueeze(0).to(device)
-            with torch.no_grad():
-                image_features = model.encode_image(image_tensor)
-                embedding = image_features.cpu().numpy().flatten().tolist()
-
-            patches.append(
-                FramePatch(
-                    patch_type=config["patch_type"],
-                    x=x,
-                    y=y,
-                    width=w,
-                    height=h,
-                    embedding=embedding,
-                )
-            )
-
-        except Exception as e:
-            logger.error(f"❌ Error processing patch {config['patch_type']}: {str(e)}")
-            continue
-
-    return patches
+    # all 13 patches go through the encoder together instead of one forward pass each
+    embeddings = encode_patch_batch(preprocess_frame_patches(frame, patch_configs))
+
+    return [
+        FramePatch(
+            patch_type=config["patch_type"],
+            x=config["x"],
+            y=config["y"],
+            width=config["width"],
+            height=config["height"],
+            embedding=embedding.tolist(),
+        )
+        for config, embedding in zip(patch_configs, embeddings)
+    ]
 
 
 @asynccontextmanager
@@ -378,11 +1033,7 @@ app.router.lifespan_context = lifespan
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
-    return {
-        "status": "healthy",
-        "model_loaded": model is not None,
-        "device": str(device) if device else None,
-    }
+    return health_response(model is not None, device)
 
 
 @app.post("/embed/single", response_model=Dict[str, Any])
@@ -391,44 +1042,38 @@ async def generate_single_embedding(file: UploadFile = File(...)):
         logger.info(
             f"[EMBED/SINGLE] Received file: {file.filename}, content_type: {file.content_type}"
         )
+        loop = asyncio.get_running_loop()
         contents = await file.read()
         logger.info(f"[EMBED/SINGLE] File size: {len(contents)} bytes")
-        from PIL import Image
-        import io
-
-        try:
-            image = Image.open(io.BytesIO(contents)).convert("RGB")
-            logger.info(f"[EMBED/SINGLE] Image loaded: {image.size}")
-        except Exception as e:
-            logger.error(f"[EMBED/SINGLE] Failed to load image: {str(e)}")
+        # decode once as BGR; the channel swap and all 13 crops happen on the uploaded tensor.
+        # Decode, preprocess and encode run in worker threads to keep the event loop free
+        image = await loop.run_in_executor(
+            None, cv2.imdecode, np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR
+        )
+        if image is None:
+            logger.error(
+                "[EMBED/SINGLE] Failed to load image: unsupported or corrupt file"
+            )
             return {"embeddings": []}
+        height, width = image.shape[:2]
+        logger.info(f"[EMBED/SINGLE] Image loaded: {(width, height)}")
 
-        width, height = image.size
         patch_configs = generate_patch_configs(width, height)
-        embeddings = []
-        for config in patch_configs:
-            patch = image.crop(
-                (
-                    config["x"],
-                    config["y"],
-                    config["x"] + config["width"],
-                    config["y"] + config["height"],
-                )
-            )
-            image_tensor = preprocess(patch).unsqueeze(0).to(device)
-            with torch.no_grad():
-                image_features = model.encode_image(image_tensor)
-                embedding = image_features.cpu().numpy().flatten().tolist()
-            embeddings.append(
-                {
-                    "patch_type": config["patch_type"],
-                    "embedding": embedding,
-                    "x": config["x"],
-                    "y": config["y"],
-                    "width": config["width"],
-                    "height": config["height"],
-                }
-            )
+        features = await loop.run_in_executor(
+            None,
+            lambda: encode_patch_batch(preprocess_frame_patches(image, patch_configs)),
+        )
+        embeddings = [
+            {
+                "patch_type": config["patch_type"],
+                "embedding": embedding.tolist(),
+                "x": config["x"],
+                "y": config["y"],
+                "width": config["width"],
+                "height": config["height"],
+            }
+            for config, embedding in zip(patch_configs, features)
+        ]
         logger.info(
             f"[EMBED/SINGLE] Returning {len(embeddings)} patch embeddings for screenshot"
         )
@@ -440,6 +1085,10 @@ async def generate_single_embedding(file: UploadFile = File(...)):
         raise
 
 
+# upper bound on images per forward pass in /embed/batch
+EMBED_PATHS_MAX_BATCH = 64
+
+
 @app.post("/embed/batch", response_model=EmbeddingResponse)
 async def generate_batch_embeddings(request: EmbeddingRequest):
     """
@@ -450,31 +1099,48 @@ async def generate_batch_embeddings(request: EmbeddingRequest):
         List of embeddings with metadata
     """
     try:
-        embeddings = []
+        loop = asyncio.get_running_loop()
+        image_paths = []
         for image_path in request.image_paths:
-            try:
-                if not os.path.exists(image_path):
-                    logger.warning(f"⚠️  Image file not found: {image_path}")
-                    continue
-                image = Image.open(image_path).convert("RGB")
-                image_tensor = preprocess(image).unsqueeze(0).to(device)
-                with torch.no_grad():
-                    image_features = model.encode_image(image_tensor)
-                    embedding = image_features.cpu().numpy().flatten().tolist()
+            if not os.path.exists(image_path):
+                logger.warning(f"⚠️  Image file not found: {image_path}")
+                continue
+            image_paths.append(image_path)
+
+        # decode + preprocess every image in parallel worker threads
+        tensors = await asyncio.gather(
+            *[
+                loop.run_in_executor(None, load_and_preprocess, image_path)
+                for image_path in image_paths
+            ],
+            return_exceptions=True,
+        )
+        loaded = []
+        for image_path, image_tensor in zip(image_paths, tensors):
+            if isinstance(image_tensor, Exception):
+                logger.error(f"❌ Error processing {image_path}: {str(image_tensor)}")
+            else:
+                loaded.append((image_path, image_tensor))
+
+        # one forward pass per EMBED_PATHS_MAX_BATCH images instead of one per image
+        embeddings = []
+        for start in range(0, len(loaded), EMBED_PATHS_MAX_BATCH):
+            chunk = loaded[start : start + EMBED_PATHS_MAX_BATCH]
+            features = await loop.run_in_executor(
+                None, encode_patch_batch, torch.cat([t for _, t in chunk])
+            )
+            for (image_path, _), embedding in zip(chunk, features):
                 embeddings.append(
                     {
                         "path": image_path,
-                        "embedding": embedding,
+                        "embedding": embedding.tolist(),
                         "dimensions": len(embedding),
                         "filename": os.path.basename(image_path),
                     }
                 )
-                logger.info(
-                    f"✅ Generated embedding for: {os.path.basename(image_path)}"
-                )
-            except Exception as e:
-                logger.error(f"❌ Error processing {image_path}: {str(e)}")
-                continue
+        logger.info(
+            f"✅ Generated {len(embeddings)}/{len(request.image_paths)} batch embeddings"
+        )
         return EmbeddingResponse(
             embeddings=embeddings,
             model_info={
@@ -600,114 +1266,206 @@ def process_video_job(request, job_id):
                 }
                 for idx, frame_path in enumerate(frame_files)
             ]
+            total_frames = len(extracted_frames)
+            job_timestamps = [f["timestamp"] for f in extracted_frames]
+            frame_stream = iter(extracted_frames)
         else:
-            extracted_frames = extract_frames_from_video(
+            # decode straight from the ffmpeg pipe instead of writing JPEGs and reading them back
+            try:
+                total_frames = math.ceil(
+                    probe_video_stream(request.video_path)["nb_frames"]
+                    / request.frame_interval
+                )
+            except Exception as e:
+                logger.warning(
+                    f"[Job {job_id}] Could not estimate frame count: {str(e)}"
+                )
+                total_frames = 0
+            job_timestamps = range(1, total_frames + 1)
+            frame_stream = stream_every_nth_frame_ffmpeg(
                 request.video_path, request.output_dir, request.frame_interval
             )
 
-        total_frames = len(extracted_frames)
         with job_status_lock:
             job_status[job_id]["status"] = "processing"
             job_status[job_id]["total"] = total_frames
             job_status[job_id]["progress"] = 0
 
+        # check ChromaDB once for every vector ID this job will write
+        movie_title_safe = movie_title.replace(" ", "_")
+        patch_types = [config["patch_type"] for config in generate_patch_configs(2, 2)]
+        existing_ids = set()
+        if collection is not None and total_frames:
+            all_ids = [
+                f"{movie_title_safe}_{timestamp:06d}_{patch_type}"
+                for timestamp in job_timestamps
+                for patch_type in patch_types
+            ]
+            try:
+                existing_ids = set(collection.get(ids=all_ids, include=[])["ids"])
+                logger.info(
+                    f"[Job {job_id}] {len(existing_ids)}/{len(all_ids)} patch embeddings already in ChromaDB"
+                )
+            except Exception as e:
+                logger.error(
+                    f"[Job {job_id}] Error checking existing embeddings: {str(e)}"
+                )
+
+        # lossy and only shrinks the upsert payload, so off unless asked for; int8-level
+        # embeddings rank identically only under cosine distance
+        quantize = (
+            collection is not None
+            and os.getenv("CHROMA_QUANTIZE_EMBEDDINGS", "0") == "1"
+            and collection_space(collection) == "cosine"
+        )
+        # inner-product collections expect unit vectors so 1 - dot stays a cosine distance
+        normalize = collection is not None and collection_space(collection) == "ip"
+
         BATCH_SIZE = 20
-        batches = [
-            extracted_frames[i : i + BATCH_SIZE]
-            for i in range(0, total_frames, BATCH_SIZE)
-        ]
-        for batch_idx, batch in enumerate(batches):
+        PATCH_CHUNK_SIZE = 128
+        upserts = []
+
+        def upsert_batch(frame_count, **records):
+            try:
+                collection.upsert(**records)
+            finally:
+                with job_status_lock:
+                    job_status[job_id]["progress"] += frame_count
+
+        total_batches = math.ceil(total_frames / BATCH_SIZE)
+
+        def decode_batches():
+            # decode stage: read and preprocess the next batch while the previous one is encoded
+            for batch in iter(
+                lambda: list(itertools.islice(frame_stream, BATCH_SIZE)), []
+            ):
+                prepared = {}
+                for i, frame_info in enumerate(batch):
+                    # skip frames whose patches are all embedded already
+                    if all(
+                        f"{movie_title_safe}_{frame_info['timestamp']:06d}_{patch_type}"
+                        in existing_ids
+                        for patch_type in patch_types
+                    ):
+                        continue
+                    frame_path = frame_info["path"]
+                    try:
+                        frame = frame_info.get("frame")
+                        if frame is None:
+                            frame = read_frame(frame_path)
+                        if frame is not None:
+                            height, width = frame.shape[:2]
+                            patch_configs = generate_patch_configs(width, height)
+                            prepared[i] = (
+                                patch_configs,
+                                preprocess_frame_patches(frame, patch_configs),
+                            )
+                    except Exception as e:
+                        logger.error(
+                            f"[Job {job_id}] Error loading {frame_path}: {str(e)}"
+                        )
+                yield batch, prepared
+
+        # decode (prefetch thread) and encode/upsert (this thread) overlap
+        batches = prefetch(decode_batches(), depth=2, name=f"decode-{job_id[:8]}")
+        for batch_idx, (batch, prepared) in enumerate(batches):
             logger.info(
-                f"[Job {job_id}] Embedding batch {batch_idx+1}/{len(batches)} (size {len(batch)})..."
+                f"[Job {job_id}] Embedding batch {batch_idx+1}/{total_batches} (size {len(batch)})..."
             )
             paths = [f["path"] for f in batch]
             timestamps = [f["timestamp"] for f in batch]
-            existing = set()
-            if collection is not None:
-                try:
-                    existing_ids = set(collection.get(ids=paths)["ids"])
-                    existing = set(existing_ids)
-                except Exception as e:
-                    logger.error(
-                        f"[Job {job_id}] Error checking existing embeddings: {str(e)}"
-                    )
-            image_tensors = []
-            valid_indices = []
-            valid_paths = []
-            valid_timestamps = []
-            created_ats = []
-            vector_ids = []
             patch_vector_ids = []
-            patch_embeddings = []
+            patch_batches = []
             patch_metadatas = []
-            for i, frame_path in enumerate(paths):
-                if frame_path in existing:
-                    continue
-                try:
-                    image = Image.open(frame_path).convert("RGB")
-                    image_tensor = preprocess(image).unsqueeze(0)
-                    frame = cv2.imread(frame_path)
-                    if frame is not None:
-                        height, width = frame.shape[:2]
-                        patch_configs = generate_patch_configs(width, height)
-                        for config in patch_configs:
-                            x, y, w, h = (
-                                config["x"],
-                                config["y"],
-                                config["width"],
-                                config["height"],
-                            )
-                            patch_type = config["patch_type"]
-                            patch = frame[y : y + h, x : x + w]
-                            patch_rgb = cv2.cvtColor(patch, cv2.COLOR_BGR2RGB)
-                            pil_patch = Image.fromarray(patch_rgb)
-                            patch_tensor = preprocess(pil_patch).unsqueeze(0).to(device)
-                            with torch.no_grad():
-                                patch_features = model.encode_image(patch_tensor)
-                                patch_embedding = (
-                                    patch_features.cpu().numpy().flatten().tolist()
-                                )
-                            # deterministic vector ID: {movieTitle}_{timestamp}_{patchType}
-                            movie_title_safe = movie_title.replace(" ", "_")
-                            vector_id = (
-                                f"{movie_title_safe}_{timestamps[i]:06d}_{patch_type}"
-                            )
-                            patch_vector_ids.append(vector_id)
-                            patch_embeddings.append(patch_embedding)
-                            patch_metadatas.append(
-                                {
-                                    "framePath": frame_path,
-                                    "timestamp": timestamps[i],
-                                    "movieTitle": movie_title,
-                                    "director": director,
-                                    "movieUrl": movie_url,
-                                    "patchType": patch_type,
-                                    "x": x,
-                                    "y": y,
-                                    "width": w,
-                                    "height": h,
-                                    "createdAt": datetime.utcnow().isoformat(),
-                                }
-                            )
-                except Exception as e:
-                    logger.error(f"[Job {job_id}] Error loading {frame_path}: {str(e)}")
+            for i, (patch_configs, frame_patches) in prepared.items():
+                frame_path = paths[i]
+                # collect the frame's patches; the whole batch is encoded at once below
+                patch_batches.append(frame_patches)
+                for config in patch_configs:
+                    x, y, w, h = (
+                        config["x"],
+                        config["y"],
+                        config["width"],
+                        config["height"],
+                    )
+                    patch_type = config["patch_type"]
+                    # deterministic vector ID: {movieTitle}_{timestamp}_{patchType}
+                    vector_id = f"{movie_title_safe}_{timestamps[i]:06d}_{patch_type}"
+                    patch_vector_ids.append(vector_id)
+                    patch_metadatas.append(
+                        {
+                            "framePath": frame_path,
+                            "timestamp": timestamps[i],
+                            "movieTitle": movie_title,
+                            "director": director,
+                            "movieUrl": movie_url,
+                            "patchType": patch_type,
+                            "x": x,
+                            "y": y,
+                            "width": w,
+                            "height": h,
+                            "createdAt": datetime.utcnow().isoformat(),
+                        }
+                    )
             # upsert all patch embeddings in this batch
+            submitted = False
             if patch_vector_ids:
                 try:
-                    collection.upsert(
-                        ids=patch_vector_ids,
-                        embeddings=patch_embeddings,
-                        metadatas=patch_metadatas,
+                    # up to 20 frames x 13 patches, encoded in a few large forward passes
+                    patch_embeddings = np.concatenate(
+                        [
+                            encode_patch_batch(chunk)
+                            for chunk in torch.split(
+                                torch.cat(patch_batches), PATCH_CHUNK_SIZE
+                            )
+                        ]
+                    )
+                    if quantize:
+                        patch_embeddings = quantize_embeddings(patch_embeddings)
+                    elif normalize:
+                        patch_embeddings = normalize_embeddings(patch_embeddings)
+                    # bound in-flight writes so a slow ChromaDB applies backpressure
+                    in_flight = [upsert for upsert in upserts if not upsert.done()]
+                    if len(in_flight) >= UPSERT_MAX_PENDING:
+                        wait(in_flight, return_when=FIRST_COMPLETED)
+                    upserts.append(
+                        upsert_executor.submit(
+                            upsert_batch,
+                            len(batch),
+                            ids=patch_vector_ids,
+                            embeddings=patch_embeddings,
+                            metadatas=patch_metadatas,
+                        )
                     )
+                    submitted = True
                 except Exception as e:
                     logger.error(
-                        f"[Job {job_id}] Error upserting patch batch to ChromaDB: {str(e)}"
+                        f"[Job {job_id}] Error embedding patch batch: {str(e)}"
                     )
-            logger.info(f"[Job {job_id}] Finished batch {batch_idx+1}/{len(batches)}")
-            with job_status_lock:
-                job_status[job_id]["progress"] += len(batch)
+            logger.info(f"[Job {job_id}] Finished batch {batch_idx+1}/{total_batches}")
+            # batches with a write in flight count towards progress once it lands
+            if not submitted:
+                with job_status_lock:
+                    job_status[job_id]["progress"] += len(batch)
+
+        # wait for the outstanding writes before reporting the job finished
+        wait(upserts)
+        failed = [upsert.exception() for upsert in upserts if upsert.exception()]
+        for e in failed:
+            logger.error(
+                f"[Job {job_id}] Error upserting patch batch to ChromaDB: {str(e)}"
+            )
         with job_status_lock:
-            job_status[job_id]["status"] = "done"
+            # the streamed frame count is only an estimate until the pipe is drained
+            job_status[job_id]["total"] = job_status[job_id]["progress"]
+            if failed:
+                error = (
+                    f"{len(failed)}/{len(upserts)} ChromaDB upserts failed: {failed[0]}"
+                )
+                job_status[job_id]["status"] = "error"
+                job_status[job_id]["error"] = error
+            else:
+                job_status[job_id]["status"] = "done"
         logger.info(f"[Job {job_id}] Video processing complete.")
     except Exception as e:
         logger.error(f"[Job {job_id}] Error: {str(e)}")
@@ -742,8 +1500,14 @@ async def upsert_vectors(request: dict):
         ids = [v["id"] for v in vectors]
         embeddings = [v["embedding"] for v in vectors]
         metadatas = [v["metadata"] for v in vectors]
+        if collection_space(collection) == "ip":
+            embeddings = normalize_embeddings(embeddings)
 
-        collection.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas)
+        # ChromaDB calls block, so run them in a worker thread and keep the event loop serving requests
+        await asyncio.to_thread(
+            collection.upsert, ids=ids, embeddings=embeddings, metadatas=metadatas
+        )
+        vector_count_cache["value"] = None
 
         logger.info(f"✅ Upserted {len(vectors)} vectors to ChromaDB")
         return {"status": "success", "count": len(vectors)}
@@ -757,7 +1521,10 @@ async def upsert_vectors(request: dict):
 
 @app.post("/vector-db/query")
 async def query_vectors(request: dict):
-    """Query similar vectors."""
+    """
+    Query similar vectors. `score` is the collection's distance: 1 - cosine similarity for
+    cosine, 1 - dot for inner product (the same value, as both sides are unit vectors there).
+    """
     if collection is None:
         logger.error("ChromaDB collection is not initialized. Cannot query vectors.")
         return {"error": "ChromaDB collection not initialized"}
@@ -769,9 +1536,14 @@ async def query_vectors(request: dict):
 
         if not embedding:
             raise HTTPException(status_code=400, detail="No embedding provided")
-
-        results = collection.query(
-            query_embeddings=[embedding], n_results=limit, where=filter_dict
+        if collection_space(collection) == "ip":
+            embedding = normalize_embeddings([embedding])[0]
+
+        results = await asyncio.to_thread(
+            collection.query,
+            query_embeddings=[embedding],
+            n_results=limit,
+            where=filter_dict,
         )
 
         formatted_results = []
@@ -795,7 +1567,9 @@ async def query_vectors(request: dict):
 
         fallback_vectors = []
         if not filtered_results:
-            fallback = collection.query(query_embeddings=[embedding], n_results=10)
+            fallback = await asyncio.to_thread(
+                collection.query, query_embeddings=[embedding], n_results=10
+            )
             if fallback["ids"] and fallback["ids"][0]:
                 for i in range(len(fallback["ids"][0])):
                     fallback_vectors.append(
@@ -827,19 +1601,35 @@ async def query_vectors(request: dict):
 
 @app.delete("/vector-db/delete")
 async def delete_vectors(request: dict):
-    """Delete vectors by frame ID."""
+    """
+    Delete the vectors of one frame ("frameId") or several ("frameIds") with one metadata filter,
+    which also catches vectors written before a restart or by another worker. Vector IDs passed
+    in "ids" are deleted as well.
+    """
     if collection is None:
         logger.error("ChromaDB collection is not initialized. Cannot delete vectors.")
         return {"error": "ChromaDB collection not initialized"}
     try:
         frame_id = request.get("frameId")
-        if not frame_id:
+        frame_ids = request.get("frameIds") or ([frame_id] if frame_id else [])
+        if not frame_ids:
             raise HTTPException(status_code=400, detail="No frame ID provided")
 
-        collection.delete(where={"frameId": frame_id})
+        ids = request.get("ids")
+        if ids:
+            await asyncio.to_thread(collection.delete, ids=list(ids))
+        await asyncio.to_thread(
+            collection.delete, where={"frameId": {"$in": frame_ids}}
+        )
+        vector_count_cache["value"] = None
 
-        logger.info(f"✅ Deleted vectors for frame {frame_id}")
-        return {"status": "success", "message": f"Deleted vectors for frame {frame_id}"}
+        deleted = (
+            f"frame {frame_ids[0]}"
+            if len(frame_ids) == 1
+            else f"{len(frame_ids)} frames"
+        )
+        logger.info(f"✅ Deleted vectors for {deleted}")
+        return {"status": "success", "message": f"Deleted vectors for {deleted}"}
 
     except Exception as e:
         logger.error(f"❌ Error deleting vectors: {str(e)}")
@@ -848,6 +1638,12 @@ async def delete_vectors(request: dict):
         )
 
 
+# /vector-db/stats is polled by dashboards, so collection.count() is refreshed at most
+# every VECTOR_COUNT_TTL_S seconds; upserts and deletes through this API invalidate it
+VECTOR_COUNT_TTL_S = float(os.getenv("VECTOR_COUNT_TTL_S", "2"))
+vector_count_cache = {"value": None, "ts": 0.0}
+
+
 @app.get("/vector-db/stats")
 async def get_db_stats():
     """Get database statistics."""
@@ -855,7 +1651,14 @@ async def get_db_stats():
         logger.error("ChromaDB collection is not initialized. Cannot get stats.")
         return {"error": "ChromaDB collection not initialized"}
     try:
-        count = collection.count()
+        if (
+            vector_count_cache["value"] is None
+            or time.monotonic() - vector_count_cache["ts"] >= VECTOR_COUNT_TTL_S
+        ):
+            vector_count_cache.update(
+                value=await asyncio.to_thread(collection.count), ts=time.monotonic()
+            )
+        count = vector_count_cache["value"]
 
         return {
             "total_vectors": count,
@@ -870,23 +1673,223 @@ async def get_db_stats():
         )
 
 
+def load_and_preprocess(frame_path: str) -> torch.Tensor:
+    """Decode an image and run the CLIP preprocess, returning a (1, 3, 224, 224) CPU tensor."""
+    image = Image.open(frame_path)
+    # preprocess shrinks the short side to 224 anyway, so let libjpeg decode JPEGs at the
+    # smallest 1/2..1/8 scale that keeps both sides >= 224 (a no-op for other formats)
+    image.draft("RGB", (224, 224))
+    # convert() copies the whole pixel buffer even when the mode already matches
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return preprocess(image).unsqueeze(0)
+
+
+def encode_debug_images(image_batch: torch.Tensor) -> np.ndarray:
+    """Encode a (N, 3, 224, 224) CPU batch with ONNX Runtime or the CLIP model into float32 rows."""
+    if onnx_session is not None:
+        return run_onnx_visual(image_batch)
+    if device.type != "cuda":
+        with torch.inference_mode(), autocast_context():
+            return model.encode_image(image_batch).float().numpy()
+
+    # staged through the same pinned ring as frames; the upload and cast run on copy_stream
+    return encode_image_rows(tensor_to_device(image_batch, model_dtype))
+
+
+# concurrent /debug/embedding misses are collected for up to DEBUG_EMBED_WAIT_MS and encoded together
+DEBUG_EMBED_MAX_BATCH = int(os.getenv("DEBUG_EMBED_MAX_BATCH", "16"))
+DEBUG_EMBED_WAIT_MS = float(os.getenv("DEBUG_EMBED_WAIT_MS", "5"))
+debug_embed_queue = None
+debug_batcher_task = None
+
+
+async def debug_embedding_batcher():
+    """Encode queued /debug/embedding images in batches of up to DEBUG_EMBED_MAX_BATCH."""
+    loop = asyncio.get_running_loop()
+    while True:
+        items = [await debug_embed_queue.get()]
+        deadline = loop.time() + DEBUG_EMBED_WAIT_MS / 1000
+        while len(items) < DEBUG_EMBED_MAX_BATCH:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(debug_embed_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        try:
+            features = await loop.run_in_executor(
+                None,
+                encode_debug_images,
+                torch.cat([image_tensor for image_tensor, _ in items]),
+            )
+            for (_, future), embedding in zip(items, features):
+                if not future.done():
+                    future.set_result(embedding)
+        except Exception as e:
+            logger.error(f"❌ Error encoding batch of {len(items)} images: {str(e)}")
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+
+
+async def encode_debug_image_batched(image_tensor: torch.Tensor) -> np.ndarray:
+    """Queue a preprocessed (1, 3, 224, 224) image for the batcher and await its embedding."""
+    global debug_embed_queue, debug_batcher_task
+    loop = asyncio.get_running_loop()
+    # (re)start the batcher in the loop serving this request
+    if (
+        debug_batcher_task is None
+        or debug_batcher_task.done()
+        or debug_batcher_task.get_loop() is not loop
+    ):
+        debug_embed_queue = asyncio.Queue()
+        debug_batcher_task = loop.create_task(debug_embedding_batcher())
+    future = loop.create_future()
+    await debug_embed_queue.put((image_tensor, future))
+    return await future
+
+
+# little-endian numpy dtypes for ?format=bin responses
+BINARY_EMBEDDING_DTYPES = {"f32": "<f4", "f16": "<f2"}
+
+
 @app.get("/debug/embedding/{frame_path:path}")
-async def debug_embedding(frame_path: str):
-    """Debug endpoint: print the embedding for a given image path."""
+async def debug_embedding(
+    frame_path: str,
+    response_format: str = Query("json", alias="format"),
+    dtype: Literal["f32", "f16"] = "f32",
+):
+    """
+    Debug endpoint: print the embedding for a given image path.
+    With ?format=bin the embedding is returned as raw little-endian float32 bytes,
+    or float16 with &dtype=f16 to halve the payload.
+    """
     try:
-        image = Image.open(frame_path).convert("RGB")
-        image_tensor = preprocess(image).unsqueeze(0).to(device)
-        with torch.no_grad():
-            image_features = model.encode_image(image_tensor)
-            embedding = image_features.cpu().numpy().flatten().tolist()
-        logger.info(f"[DEBUG] Embedding for {frame_path}: {embedding}")
-        return JSONResponse({"embedding": embedding})
+        # mtime and size change whenever the file is rewritten, so stale entries are never served;
+        # stat off the event loop, since on a network mount it can block like a read
+        stat = await asyncio.to_thread(os.stat, frame_path)
+        cache_key = (frame_path, stat.st_mtime_ns, stat.st_size)
+        embedding = debug_embedding_cache.get(cache_key)
+        if embedding is None:
+            # decode + preprocess in a worker thread so other requests aren't blocked meanwhile
+            image_tensor = await asyncio.get_running_loop().run_in_executor(
+                None, load_and_preprocess, frame_path
+            )
+            embedding = await encode_debug_image_batched(image_tensor)
+            debug_embedding_cache.put(cache_key, embedding)
+        # the vector itself is in the response; the log only gets a summary, and only at DEBUG
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "[DEBUG] Embedding for %s: %d floats, norm %.4f",
+                frame_path,
+                embedding.shape[0],
+                float(np.linalg.norm(embedding)),
+            )
+        if response_format == "bin":
+            return Response(
+                content=embedding.astype(BINARY_EMBEDDING_DTYPES[dtype]).tobytes(),
+                media_type="application/octet-stream",
+            )
+        return ORJSONResponse({"embedding": embedding})
     except Exception as e:
         logger.error(f"[DEBUG] Error embedding {frame_path}: {str(e)}")
-        return JSONResponse({"error": str(e)}, status_code=500)
+        return ORJSONResponse({"error": str(e)}, status_code=500)
+
+
+def stat_or_error(frame_path: str):
+    """os.stat() a path, returning the OSError instead of raising it."""
+    try:
+        return os.stat(frame_path)
+    except OSError as e:
+        return e
+
+
+# upper bound on images per forward pass in /debug/embeddings
+DEBUG_MAX_BATCH = 64
+
+
+@app.post("/debug/embeddings")
+async def debug_embeddings(request: DebugEmbeddingsRequest):
+    """
+    Debug endpoint: embed several image paths, encoding all uncached images
+    together instead of one forward pass per image.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+        results = {}
+        pending = []
+        # one worker-thread hop stats every path, keeping filesystem calls off the event loop
+        stats = await asyncio.to_thread(
+            lambda: [stat_or_error(frame_path) for frame_path in request.paths]
+        )
+        for frame_path, stat in zip(request.paths, stats):
+            if isinstance(stat, OSError):
+                results[frame_path] = {"path": frame_path, "error": str(stat)}
+                continue
+            cache_key = (frame_path, stat.st_mtime_ns, stat.st_size)
+            embedding = debug_embedding_cache.get(cache_key)
+            if embedding is None:
+                pending.append((frame_path, cache_key))
+            else:
+                results[frame_path] = {"path": frame_path, "embedding": embedding}
+
+        # decode + preprocess every image in parallel worker threads
+        tensors = await asyncio.gather(
+            *[
+                loop.run_in_executor(None, load_and_preprocess, frame_path)
+                for frame_path, _ in pending
+            ],
+            return_exceptions=True,
+        )
+        loaded = []
+        for (frame_path, cache_key), image_tensor in zip(pending, tensors):
+            if isinstance(image_tensor, Exception):
+                results[frame_path] = {"path": frame_path, "error": str(image_tensor)}
+            else:
+                loaded.append((frame_path, cache_key, image_tensor))
+
+        for start in range(0, len(loaded), DEBUG_MAX_BATCH):
+            chunk = loaded[start : start + DEBUG_MAX_BATCH]
+            # the forward pass runs in a worker thread so other requests keep being served
+            features = await loop.run_in_executor(
+                None, encode_debug_images, torch.cat([t for _, _, t in chunk])
+            )
+            for (frame_path, cache_key, _), embedding in zip(chunk, features):
+                debug_embedding_cache.put(cache_key, embedding)
+                results[frame_path] = {"path": frame_path, "embedding": embedding}
+
+        embeddings = [results[frame_path] for frame_path in request.paths]
+        logger.info(
+            f"[DEBUG] Embedded {len(loaded)} of {len(request.paths)} images ({len(request.paths) - len(pending)} cached)"
+        )
+        return ORJSONResponse({"embeddings": embeddings})
+    except Exception as e:
+        logger.error(f"[DEBUG] Error embedding batch: {str(e)}")
+        return ORJSONResponse({"error": str(e)}, status_code=500)
+
+
+@app.get("/debug/cache-stats")
+async def debug_cache_stats():
+    """Debug endpoint: hit-rate stats of the debug embedding cache."""
+    return debug_embedding_cache.stats()
 
 
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run("main:app", host="0.0.0.0", port=8080, log_level="info", reload=True)
+    uvicorn.run(
+        "dev_main:app",
+        host="0.0.0.0",
+        port=8080,
+        log_level="info",
+        # the reloader forks a watcher and reloads the model on every file change; dev only
+        reload=bool(os.getenv("DEV")),
+        # each worker loads its own model and keeps its own job status and caches, and a local
+        # PersistentClient must not be shared between processes: only raise this with a remote
+        # ChromaDB (CHROMA_DB_URL) and a client that doesn't poll /status across workers
+        workers=None if os.getenv("DEV") else int(os.getenv("WORKERS", "1")),
+        loop="uvloop",
+        http="httptools",
+    )
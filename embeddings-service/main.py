@@ -1,27 +1,39 @@
 import os
 import io
+import math
+import functools
+import itertools
 import logging
+import asyncio
+import time
 import tempfile
-from typing import List, Dict, Any, Tuple, Optional
+import mmap
+from typing import List, Dict, Any, Tuple, Optional, Iterator, Sequence, Literal
 from pathlib import Path
 
 import torch
+import torch.nn.functional as F
+import torchvision
+from torchvision.io import ImageReadMode
 import open_clip
 from PIL import Image
 import numpy as np
 import cv2
-from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks
+from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-import uvicorn
 import chromadb
 from chromadb.config import Settings
 import os
 import uuid
 from datetime import datetime
-from threading import Lock
+from threading import Thread, Event, local
+import queue
+from concurrent.futures import ThreadPoolExecutor
 import glob
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, Response
+from common import setup_logging, hnsw_configuration, collection_space, normalize_embeddings, quantize_embeddings, prefetch, health_response, staging_buffer, FrameWriter
 import subprocess
 import json
 from dotenv import load_dotenv
@@ -40,7 +52,9 @@ async def lifespan(app: FastAPI):
     logger.info("[LOG] Lifespan handler START (before model/db init)")
     global model, preprocess, device, chroma_client, collection
     model, preprocess = load_model()
+    warmup_model()
     init_chroma_db()
+    start_upsert_worker()
     logger.info("[LOG] Lifespan handler END (after model/db init)")
     yield
     logger.info("[LOG] Lifespan handler SHUTDOWN (after yield)")
@@ -51,7 +65,7 @@ def excepthook(exc_type, exc_value, exc_traceback):
 
 sys.excepthook = excepthook
 
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 print("[LOG] main.py module imported (process startup)")
@@ -75,7 +89,9 @@ app = FastAPI(
     title="Movie Video Archive - Embeddings Service",
     description="Microservice for generating image embeddings using OpenCLIP for movies",
     version="1.0.0",
-    lifespan=lifespan  
+    lifespan=lifespan,
+    # orjson serializes the 512-float embedding lists (and numpy arrays) far faster than stdlib json
+    default_response_class=ORJSONResponse
 )
 
 logger.info("[LOG] FastAPI app instance created")
@@ -91,12 +107,52 @@ app.add_middleware(
 model = None
 preprocess = None
 device = None
+model_dtype = None
+clip_mean = None
+clip_std = None
+copy_stream = None
+visual_compiled = False
+
+CLIP_IMAGE_SIZE = 224
+
+# every image-encoder forward pass runs on this one thread (see encode_padded_batch): request handlers
+# await it so the event loop never blocks, and job threads hand it their batches because reduce-overhead
+# CUDA graphs are recorded per thread, so the graphs warmed up in load_model are only reused here
+inference_thread = local()
+inference_executor = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="inference", initializer=lambda: setattr(inference_thread, "active", True))
+
+# concurrent /embed/single requests are collected for up to EMBED_BATCH_WAIT_MS and encoded together
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "32"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "5"))
+embed_queue = None
+embed_batcher_task = None
+
+# upper bound on images per forward pass in /embed/batch
+EMBED_PATHS_MAX_BATCH = 64
 
 chroma_client = None
 collection = None
 
-job_status = {}
-job_status_lock = Lock()
+class JobState:
+    """
+    Progress of one background video job. Only the job's own thread writes these fields and
+    each is a single attribute store, so /status can read them without a shared lock.
+    """
+    __slots__ = ("status", "progress", "total", "error")
+
+    def __init__(self):
+        self.status = "pending"
+        self.progress = 0
+        self.total = 0
+        self.error = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"status": self.status, "progress": self.progress, "total": self.total, "error": self.error}
+
+job_status: Dict[str, JobState] = {}
+
+upsert_queue = None
 
 class EmbeddingRequest(BaseModel):
     image_paths: List[str]
@@ -131,7 +187,7 @@ class VideoProcessingResponse(BaseModel):
 
 def load_model():
     """Load OpenCLIP model and preprocessor."""
-    global model, preprocess, device
+    global model, preprocess, device, model_dtype, clip_mean, clip_std, copy_stream, visual_compiled
     
     if model is None:
         logger.info("🤖 Loading OpenCLIP model...")
@@ -144,11 +200,59 @@ def load_model():
             pretrained="openai",
             device=device
         )
+        model.eval()
+        # grad mode is per thread, so freezing the weights also covers encodes on executor threads
+        model.requires_grad_(False)
+        
+        # CLIP ViT-B/32 runs in FP16 on GPU without hurting retrieval quality
+        if device.type == "cuda":
+            model = model.half()
+            # NHWC lets the patch-embedding conv pick Tensor Core kernels; encode_image_batch matches it
+            model.visual = model.visual.to(memory_format=torch.channels_last)
+        model_dtype = torch.float16 if device.type == "cuda" else torch.float32
+        clip_mean = torch.tensor(open_clip.OPENAI_DATASET_MEAN, device=device).view(3, 1, 1)
+        clip_std = torch.tensor(open_clip.OPENAI_DATASET_STD, device=device).view(3, 1, 1)
+        # frame uploads go on their own stream so they overlap with encoding on the default stream
+        if device.type == "cuda":
+            copy_stream = torch.cuda.Stream(device=device)
+            # input shapes are fixed, so let cuDNN benchmark once and keep the fastest kernels
+            torch.backends.cudnn.benchmark = True
+        
+        # preprocess always yields 3x224x224, so the image tower can be compiled for static shapes
+        if device.type == "cuda" and os.getenv("CLIP_COMPILE", "1") == "1":
+            eager_visual = model.visual
+            try:
+                logger.info("⚙️  Compiling OpenCLIP image encoder...")
+                model.visual = torch.compile(eager_visual, mode="reduce-overhead", dynamic=False)
+                visual_compiled = True
+                # compile and record a graph on the inference thread for every batch size encode_padded_batch produces, before serving
+                for size in (1 << i for i in range(EMBED_PATHS_MAX_BATCH.bit_length())):
+                    encode_padded_batch(torch.zeros(size, 3, CLIP_IMAGE_SIZE, CLIP_IMAGE_SIZE))
+            except Exception as e:
+                logger.warning(f"⚠️  torch.compile failed, using eager image encoder: {e}")
+                model.visual = eager_visual
+                visual_compiled = False
         
-        logger.info("✅ OpenCLIP model loaded successfully")
+        logger.info(f"✅ OpenCLIP model loaded successfully ({model_dtype})")
     
     return model, preprocess
 
+def warmup_model():
+    """
+    Run the frame and single-image paths on dummy input so cuDNN autotuning, kernel JIT and
+    CUDA graph capture happen at startup rather than on the first request.
+    """
+    logger.info("🔥 Warming up OpenCLIP model...")
+    frame = np.zeros((1080, 1920, 3), dtype=np.uint8)
+    for _ in range(2):
+        frame_t = frame_to_tensor(frame, device)
+        encode_padded_batch(preprocess_frame_patches(frame_t, generate_patch_configs(1920, 1080), device))
+        full_patch = {"patch_type": "full", "x": 0, "y": 0, "width": 1920, "height": 1080}
+        encode_padded_batch(preprocess_frame_patches(frame_t, [full_patch], device))
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    logger.info("✅ Model warmed up")
+
 def init_chroma_db():
     """Initialize ChromaDB client and collection."""
     global chroma_client, collection
@@ -168,16 +272,53 @@ def init_chroma_db():
                 metadata={"description": "Movie video frame embeddings"},
                 embedding_function=None,
                 configuration={
-                    "hnsw": {
-                        "space": "cosine",
-                    }
+                    "hnsw": hnsw_configuration()
                 }
             )
-            logger.info("✅ Created new ChromaDB collection with cosine metric")
+            logger.info(f"✅ Created new ChromaDB collection with {collection_space(collection)} metric")
+        else:
+            # a collection's metric is fixed; drop it and re-run the jobs to move to CHROMA_SPACE
+            if os.getenv("CHROMA_SPACE") and collection_space(collection) not in (None, os.getenv("CHROMA_SPACE")):
+                logger.warning(f"⚠️  Collection uses {collection_space(collection)}, not CHROMA_SPACE={os.getenv('CHROMA_SPACE')}; recreate it to migrate")
+            # M and ef_construction are fixed at creation, but ef_search can be changed in place
+            if os.getenv("CHROMA_EF_SEARCH"):
+                try:
+                    collection.modify(configuration={"hnsw": {"ef_search": int(os.getenv("CHROMA_EF_SEARCH"))}})
+                except Exception as e:
+                    logger.warning(f"⚠️  Could not update ef_search: {e}")
     return chroma_client, collection
 
-def generate_patch_configs(width: int, height: int):
-    """Generate full image, 4 quadrants, and split each quadrant vertically (13 patches total)."""
+def chroma_upsert_worker():
+    """Drain upsert_queue so ChromaDB round-trips don't block decoding/encoding of the next batch."""
+    while True:
+        item = upsert_queue.get()
+        try:
+            # a job enqueues an Event after its last batch to wait until its writes are flushed
+            if isinstance(item, Event):
+                item.set()
+                continue
+            try:
+                collection.upsert(**item["upsert"])
+            except Exception as e:
+                logger.error(f"[Job {item['job_id']}] Error upserting patch batch to ChromaDB: {str(e)}")
+        finally:
+            upsert_queue.task_done()
+
+def start_upsert_worker():
+    """Start the background ChromaDB writer thread."""
+    global upsert_queue
+    if upsert_queue is None:
+        # bounded so a slow ChromaDB applies backpressure instead of buffering a whole movie in memory
+        upsert_queue = queue.Queue(maxsize=4)
+        Thread(target=chroma_upsert_worker, name="chroma-upsert", daemon=True).start()
+        logger.info("✅ Started ChromaDB upsert worker")
+
+@functools.lru_cache(maxsize=16)
+def generate_patch_configs(width: int, height: int) -> Tuple[Dict[str, Any], ...]:
+    """
+    Generate full image, 4 quadrants, and split each quadrant vertically (13 patches total).
+    Cached per resolution since every frame of a movie shares it; treat the result as read-only.
+    """
     mid_x = width // 2
     mid_y = height // 2
 
@@ -215,10 +356,19 @@ def generate_patch_configs(width: int, height: int):
             "height": q["height"]
         })
 
-    return patches + quadrants + sub_quadrants
+    return tuple(patches + quadrants + sub_quadrants)
 
 def detect_video_codec(video_path: str) -> str:
-    """Detect the video codec using ffprobe."""
+    """Detect the video codec from the container header with PyAV if installed, else with ffprobe."""
+    try:
+        import av
+        with av.open(video_path) as container:
+            return container.streams.video[0].codec_context.name
+    except ImportError:
+        pass
+    except Exception as e:
+        logger.warning(f"[PyAV] Could not detect codec for {video_path}, trying ffprobe: {e}")
+
     cmd = [
         'ffprobe',
         '-v', 'error',
@@ -237,22 +387,147 @@ def detect_video_codec(video_path: str) -> str:
         return 'h264'
 
 
-def extract_every_nth_frame_ffmpeg(video_path: str, output_dir: str, n: int = 5) -> list:
-    """Extract every Nth frame using ffmpeg (CPU decode for all codecs). Returns list of frame info dicts."""
-    import os
-    os.makedirs(output_dir, exist_ok=True)
+# ffprobe codec name -> NVDEC (cuvid) decoder
+NVDEC_DECODERS = {
+    'h264': 'h264_cuvid',
+    'hevc': 'hevc_cuvid',
+    'av1': 'av1_cuvid',
+    'vp9': 'vp9_cuvid',
+    'vp8': 'vp8_cuvid',
+    'mpeg2video': 'mpeg2_cuvid',
+    'mpeg4': 'mpeg4_cuvid',
+}
+
+def nvdec_input_args(video_path: str) -> List[str]:
+    """ffmpeg input args to decode on the GPU with NVDEC, or [] if CUDA or a cuvid decoder is unavailable."""
+    if os.getenv("FFMPEG_NVDEC", "1") != "1" or not torch.cuda.is_available():
+        return []
+    decoder = NVDEC_DECODERS.get(detect_video_codec(video_path))
+    if decoder is None:
+        return []
+    return ['-hwaccel', 'cuda', '-hwaccel_output_format', 'cuda', '-c:v', decoder]
+
+def frame_select_filter(n: int, hw_decode: bool, offset: int = 0) -> str:
+    """Keep every Nth frame (counting from `offset`); with NVDEC only the selected frames are downloaded from the GPU."""
+    frame_index = f"n+{offset}" if offset else "n"
+    vf = f"select='not(mod({frame_index}\\,{n}))'"
+    if hw_decode:
+        vf += ",hwdownload,format=nv12"
+    return vf
+
+def probe_keyframes(video_path: str) -> Tuple[List[Tuple[int, str]], int]:
+    """
+    List (frame_index, pts_time) for every keyframe plus the total frame count.
+    Only demuxes packets, so it is cheap compared to decoding.
+    """
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags',
+        '-of', 'json',
+        video_path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    packets = [p for p in json.loads(result.stdout).get('packets', []) if p.get('pts_time', 'N/A') != 'N/A']
+    # packets come in decode order; frame indices used by the select filter are in presentation order
+    packets.sort(key=lambda p: float(p['pts_time']))
+    keyframes = [(idx, p['pts_time']) for idx, p in enumerate(packets) if 'K' in p.get('flags', '')]
+    return keyframes, len(packets)
+
+def extract_segment_frames_ffmpeg(video_path: str, output_dir: str, n: int, start_frame: int, end_frame: int, start_time: str, input_args: List[str]):
+    """Extract the selected frames of one GOP-aligned segment [start_frame, end_frame), keeping global frame numbering."""
+    first_selected = -(-start_frame // n) * n
+    if first_selected >= end_frame:
+        return
     cmd = [
         'ffmpeg',
+        '-v', 'error',
+        *input_args,
+        '-seek_timestamp', '1',
+        '-ss', start_time,
         '-i', video_path,
-        '-vf', f"select='not(mod(n\\,{n}))'",
+        '-vf', frame_select_filter(n, bool(input_args), offset=start_frame),
         '-vsync', '0',
+        '-frames:v', str((end_frame - 1 - first_selected) // n + 1),
+        '-start_number', str(first_selected // n + 1),
         '-pix_fmt', 'yuv420p',
         os.path.join(output_dir, 'frame_%06d.jpg')
     ]
-    logger.info(f"[FFMPEG] Extracting every {n}th frame from {video_path} using CPU decode (all codecs)")
-    import subprocess
     subprocess.run(cmd, check=True)
 
+# GPUs have a few NVDEC engines shared by every decode session, so more segments than this just queue on them
+NVDEC_MAX_PARALLEL_SEGMENTS = 2
+
+def extract_every_nth_frame_parallel(video_path: str, output_dir: str, n: int, workers: int, input_args: List[str]) -> bool:
+    """
+    Split the video at keyframes into `workers` segments and decode them concurrently.
+    Each GOP decodes independently after a seek, so this scales with the available decoders.
+    Returns False when the video can't be split (single GOP, no usable keyframe index).
+    """
+    keyframes, total = probe_keyframes(video_path)
+    if len(keyframes) < 2 or keyframes[0][0] != 0:
+        return False
+
+    split = [keyframes[0]]
+    for w in range(1, workers):
+        keyframe = next((k for k in keyframes if k[0] >= w * total / workers), None)
+        if keyframe is not None and keyframe[0] > split[-1][0]:
+            split.append(keyframe)
+    if len(split) < 2:
+        return False
+    segments = [
+        (start_frame, split[i + 1][0] if i + 1 < len(split) else total, start_time)
+        for i, (start_frame, start_time) in enumerate(split)
+    ]
+
+    logger.info(f"[FFMPEG] Decoding {video_path} as {len(segments)} parallel GOP segments")
+    with ThreadPoolExecutor(max_workers=len(segments)) as pool:
+        futures = [
+            pool.submit(extract_segment_frames_ffmpeg, video_path, output_dir, n, start_frame, end_frame, start_time, input_args)
+            for start_frame, end_frame, start_time in segments
+        ]
+        for future in futures:
+            future.result()
+    return True
+
+def extract_every_nth_frame_ffmpeg(video_path: str, output_dir: str, n: int = 5) -> list:
+    """Extract every Nth frame using ffmpeg (NVDEC when available, CPU otherwise). Returns list of frame info dicts."""
+    import os
+    os.makedirs(output_dir, exist_ok=True)
+    hw_args = nvdec_input_args(video_path)
+    # opt-in: each segment is its own ffmpeg process (and NVDEC session), on top of the job's decode threads
+    workers = int(os.getenv("FFMPEG_DECODE_WORKERS", "1"))
+    if hw_args:
+        workers = min(workers, NVDEC_MAX_PARALLEL_SEGMENTS)
+    extracted = False
+    if workers > 1:
+        try:
+            extracted = extract_every_nth_frame_parallel(video_path, output_dir, n, workers, hw_args)
+        except Exception as e:
+            # the single pass below rewrites the same frame_%06d.jpg names
+            logger.warning(f"[FFMPEG] Parallel GOP decode failed for {video_path}, falling back to a single pass: {e}")
+    for input_args in ([hw_args, []] if hw_args else [[]]):
+        if extracted:
+            break
+        cmd = [
+            'ffmpeg',
+            *input_args,
+            '-i', video_path,
+            '-vf', frame_select_filter(n, bool(input_args)),
+            '-vsync', '0',
+            '-pix_fmt', 'yuv420p',
+            os.path.join(output_dir, 'frame_%06d.jpg')
+        ]
+        logger.info(f"[FFMPEG] Extracting every {n}th frame from {video_path} using {'NVDEC' if input_args else 'CPU'} decode")
+        try:
+            subprocess.run(cmd, check=True)
+            extracted = True
+        except subprocess.CalledProcessError as e:
+            if not input_args:
+                raise
+            logger.warning(f"[FFMPEG] NVDEC decode failed for {video_path}, retrying on CPU: {e}")
+
     frame_files = sorted([f for f in os.listdir(output_dir) if f.endswith('.jpg')])
     frames = []
     for idx, fname in enumerate(frame_files):
@@ -268,57 +543,414 @@ def extract_every_nth_frame_ffmpeg(video_path: str, output_dir: str, n: int = 5)
     logger.info(f"[FFMPEG] Extracted {len(frames)} frames from {video_path}")
     return frames
 
+def probe_video_stream(video_path: str) -> Dict[str, int]:
+    """Read width, height and frame count of the first video stream using ffprobe."""
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'stream=width,height,nb_frames',
+        '-of', 'json',
+        video_path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    stream = json.loads(result.stdout)['streams'][0]
+    nb_frames = stream.get('nb_frames', '')
+    return {
+        'width': int(stream['width']),
+        'height': int(stream['height']),
+        'nb_frames': int(nb_frames) if str(nb_frames).isdigit() else 0
+    }
+
+def stream_every_nth_frame_ffmpeg(video_path: str, output_dir: str, n: int = 5) -> Iterator[Dict[str, Any]]:
+    """
+    Yield every Nth frame as a BGR ndarray read from an ffmpeg rawvideo pipe.
+    Frames are embedded from memory; the JPEG in output_dir is only written for framePath consumers,
+    in the background, and every write has finished once the stream is exhausted.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    info = probe_video_stream(video_path)
+    width, height = info['width'], info['height']
+    frame_size = width * height * 3
+    hw_args = nvdec_input_args(video_path)
+    writer = FrameWriter()
+    idx = 0
+    for input_args in ([hw_args, []] if hw_args else [[]]):
+        cmd = [
+            'ffmpeg',
+            '-v', 'error',
+            *input_args,
+            '-i', video_path,
+            '-vf', f"{frame_select_filter(n, bool(input_args))},scale={width}:{height}",
+            '-vsync', '0',
+            '-f', 'rawvideo',
+            '-pix_fmt', 'bgr24',
+            'pipe:1'
+        ]
+        logger.info(f"[FFMPEG] Streaming every {n}th frame from {video_path} ({width}x{height}) using {'NVDEC' if input_args else 'CPU'} decode")
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=1 << 20) as proc:
+            while True:
+                buf = proc.stdout.read(frame_size)
+                if len(buf) < frame_size:
+                    break
+                frame = np.frombuffer(buf, np.uint8).reshape(height, width, 3)
+                frame_path = os.path.join(output_dir, f'frame_{idx + 1:06d}.jpg')
+                writer.submit(cv2.imwrite, frame_path, frame)
+                yield {
+                    'path': frame_path,
+                    'timestamp': idx + 1,
+                    'frame_number': idx,
+                    'frame': frame
+                }
+                idx += 1
+            proc.stdout.close()
+            returncode = proc.wait()
+        if returncode == 0:
+            break
+        # NVDEC sessions can fail to open (unsupported profile, no free decoder); retry on CPU if nothing was read
+        if input_args and idx == 0:
+            logger.warning(f"[FFMPEG] NVDEC decode failed for {video_path}, retrying on CPU")
+            continue
+        raise subprocess.CalledProcessError(returncode, cmd)
+    writer.flush()
+    logger.info(f"[FFMPEG] Streamed {idx} frames from {video_path}")
+
+def stream_every_nth_frame_torchcodec(video_path: str, output_dir: str, n: int = 5) -> Iterator[Dict[str, Any]]:
+    """
+    Yield every Nth frame as a (3, H, W) RGB uint8 tensor decoded by TorchCodec, on the GPU
+    (NVDEC) when available. Raises ImportError when torchcodec is not installed.
+    """
+    from torchcodec.decoders import VideoDecoder
+
+    os.makedirs(output_dir, exist_ok=True)
+    decoder = VideoDecoder(video_path, device="cuda" if device.type == "cuda" else "cpu")
+    indices = range(0, decoder.metadata.num_frames, n)
+    logger.info(f"[TORCHCODEC] Decoding {len(indices)} frames from {video_path} on {device.type}")
+    for start in range(0, len(indices), 32):
+        frames = decoder.get_frames_at(indices=list(indices[start:start + 32])).data
+        for offset, frame_t in enumerate(frames):
+            idx = start + offset
+            frame_path = os.path.join(output_dir, f'frame_{idx + 1:06d}.jpg')
+            torchvision.io.write_file(frame_path, torchvision.io.encode_jpeg(frame_t, quality=95).cpu())
+            yield {
+                'path': frame_path,
+                'timestamp': idx + 1,
+                'frame_number': indices[idx],
+                'frame_t': frame_t
+            }
+
+def stream_every_nth_frame(video_path: str, output_dir: str, n: int = 5) -> Iterator[Dict[str, Any]]:
+    """Stream frames with TorchCodec, falling back to the ffmpeg pipe if it is missing or fails before the first frame."""
+    yielded = 0
+    try:
+        for frame in stream_every_nth_frame_torchcodec(video_path, output_dir, n):
+            yield frame
+            yielded += 1
+        return
+    except ImportError:
+        pass
+    except Exception as e:
+        if yielded:
+            raise
+        logger.warning(f"[TORCHCODEC] Decode failed for {video_path}, falling back to ffmpeg: {e}")
+    yield from stream_every_nth_frame_ffmpeg(video_path, output_dir, n)
+
 # extraction, ffmpeg+NVDEC
 def extract_frames_from_video(video_path: str, output_dir: str, frame_interval: int = 5) -> list:
     return extract_every_nth_frame_ffmpeg(video_path, output_dir, n=frame_interval)
 
-def generate_patch_embeddings(frame_path: str, model, preprocess, device) -> List[FramePatch]:
+def autocast_context(device):
+    """
+    FP16 autocast on GPU. On CPU, CLIP_CPU_BF16=1 enables BF16 autocast, which pays off
+    only on CPUs with native BF16 (AVX512-BF16/AMX) and is slower everywhere else.
+    """
+    if device.type == "cuda":
+        return torch.autocast(device_type="cuda", dtype=torch.float16)
+    return torch.autocast(device_type="cpu", dtype=torch.bfloat16, enabled=os.getenv("CLIP_CPU_BF16") == "1")
+
+def encode_image_batch(image_batch: torch.Tensor, model, device) -> np.ndarray:
+    """Encode a (N, 3, 224, 224) batch of preprocessed images in a single forward pass."""
+    image_batch = image_batch.to(device, dtype=model_dtype, non_blocking=True)
+    if device.type == "cuda":
+        image_batch = image_batch.contiguous(memory_format=torch.channels_last)
+    with torch.inference_mode(), autocast_context(device):
+        image_features = model.encode_image(image_batch)
+    return image_features.float().cpu().numpy()
+
+def upload_staging(staging: torch.Tensor, copied: torch.cuda.Event, device) -> torch.Tensor:
+    """Copy a filled staging buffer to `device` on copy_stream; the default stream only waits for this copy."""
+    with torch.cuda.stream(copy_stream):
+        tensor = staging.to(device, non_blocking=True)
+        copied.record(copy_stream)
+    compute_stream = torch.cuda.current_stream(device)
+    compute_stream.wait_event(copied)
+    tensor.record_stream(compute_stream)
+    return tensor
+
+def frame_to_tensor(frame: np.ndarray, device) -> torch.Tensor:
+    """Upload a BGR uint8 frame to `device` as a (3, H, W) RGB uint8 tensor."""
+    if device.type != "cuda":
+        return torch.from_numpy(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)).permute(2, 0, 1)
+
+    # convert straight into pinned memory so the copy is a real async DMA, not a pageable staging copy
+    with staging_buffer(frame.shape) as (staging, copied):
+        if staging is None:
+            return torch.from_numpy(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)).to(device).permute(2, 0, 1)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=staging.numpy())
+        return upload_staging(staging, copied, device).permute(2, 0, 1)
+
+def tensor_to_device(tensor: torch.Tensor, device) -> torch.Tensor:
+    """Upload a CPU tensor to `device` through the same pinned staging ring as frames."""
+    if device.type != "cuda":
+        return tensor
+    with staging_buffer(tuple(tensor.shape), tensor.dtype) as (staging, copied):
+        if staging is None:
+            return tensor.to(device)
+        staging.copy_(tensor)
+        return upload_staging(staging, copied, device)
+
+# libjpeg can decode at 1/2, 1/4 or 1/8 scale for almost the cost of the smaller image
+REDUCED_IMREAD_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+def jpeg_reduction(width: int, height: int) -> int:
+    """Largest JPEG decode scale that keeps the smallest patch at least CLIP_IMAGE_SIZE on its short side."""
+    smallest_side = min(width // 4, height // 2)
+    factor = 1
+    while factor < 8 and smallest_side // (factor * 2) >= CLIP_IMAGE_SIZE:
+        factor *= 2
+    return factor
+
+def read_frame_reduced(frame_path: str) -> Tuple[Optional[np.ndarray], Tuple[int, int]]:
+    """
+    Read a BGR frame with cv2, decoding large JPEGs at reduced scale since every patch is
+    resized down to 224 anyway. Also returns the source (width, height) for patch geometry.
+    """
+    if frame_path.lower().endswith(('.jpg', '.jpeg')):
+        try:
+            # one open + mmap serves both the header parse and the decode, with no copy into Python bytes
+            with open(frame_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                with Image.open(f) as im:
+                    width, height = im.size
+                flags = REDUCED_IMREAD_FLAGS[jpeg_reduction(width, height)]
+                frame = cv2.imdecode(np.frombuffer(mm, dtype=np.uint8), flags)
+            if frame is None:
+                # imdecode rejects truncated JPEGs that imread still decodes partially
+                frame = cv2.imread(frame_path, flags)
+            return frame, (width, height)
+        except Exception:
+            pass
     frame = cv2.imread(frame_path)
     if frame is None:
+        return None, (0, 0)
+    return frame, (frame.shape[1], frame.shape[0])
+
+def frame_patch_configs(frame_t: torch.Tensor, frame_size: Tuple[int, int]) -> Tuple[Sequence[Dict[str, Any]], Sequence[Dict[str, Any]]]:
+    """
+    Patch configs in source-frame coordinates (for metadata) and in the coordinates of
+    `frame_t`, which may have been decoded at reduced scale (for cropping).
+    """
+    width, height = frame_size
+    patch_configs = generate_patch_configs(width, height)
+    decoded_height, decoded_width = frame_t.shape[1:]
+    if (decoded_width, decoded_height) == (width, height):
+        return patch_configs, patch_configs
+    return patch_configs, generate_patch_configs(decoded_width, decoded_height)
+
+def load_frame_tensors(frame_paths: List[str], device) -> List[Optional[Tuple[torch.Tensor, Tuple[int, int]]]]:
+    """
+    Load frames as (3, H, W) RGB uint8 tensors on `device` together with the source
+    (width, height), None for unreadable files. On CUDA, JPEGs are decoded straight into
+    GPU memory with nvJPEG in one batched call; on CPU large JPEGs are decoded at reduced scale.
+    """
+    frames: List[Optional[Tuple[torch.Tensor, Tuple[int, int]]]] = [None] * len(frame_paths)
+    if device.type == "cuda":
+        jpeg_indices = [i for i, p in enumerate(frame_paths) if p.lower().endswith(('.jpg', '.jpeg'))]
+        if jpeg_indices:
+            try:
+                data = [torchvision.io.read_file(frame_paths[i]) for i in jpeg_indices]
+                decoded = torchvision.io.decode_jpeg(data, mode=ImageReadMode.RGB, device=device)
+                for i, frame_t in zip(jpeg_indices, decoded):
+                    frames[i] = (frame_t, (frame_t.shape[2], frame_t.shape[1]))
+            except Exception as e:
+                logger.warning(f"⚠️  nvJPEG decode failed, falling back to OpenCV: {e}")
+
+    for i, frame_path in enumerate(frame_paths):
+        if frames[i] is not None:
+            continue
+        frame, frame_size = read_frame_reduced(frame_path)
+        if frame is None:
+            logger.warning(f"⚠️  Could not load frame: {frame_path}")
+            continue
+        frames[i] = (frame_to_tensor(frame, device), frame_size)
+    return frames
+
+def preprocess_frame_patches(frame_t: torch.Tensor, patch_configs: Sequence[Dict[str, Any]], device) -> torch.Tensor:
+    """
+    Crop, resize and normalize every patch of a (3, H, W) RGB uint8 frame on `device`.
+    Mirrors the OpenCLIP preprocess (shortest side to 224, center crop, normalize)
+    but works on the uploaded frame instead of running PIL per patch.
+    """
+    frame_t = frame_t.to(device, non_blocking=True).float().div_(255)
+
+    # patches of the same size (the quadrants, the sub-quadrants) are resized together in one call
+    groups: Dict[Tuple[int, int], List[int]] = {}
+    for idx, config in enumerate(patch_configs):
+        groups.setdefault((config["width"], config["height"]), []).append(idx)
+
+    batch = torch.empty(len(patch_configs), 3, CLIP_IMAGE_SIZE, CLIP_IMAGE_SIZE, device=frame_t.device)
+    for (w, h), indices in groups.items():
+        patches = torch.stack([
+            frame_t[:, patch_configs[i]["y"]:patch_configs[i]["y"]+h, patch_configs[i]["x"]:patch_configs[i]["x"]+w]
+            for i in indices
+        ])
+        if w <= h:
+            new_w, new_h = CLIP_IMAGE_SIZE, int(CLIP_IMAGE_SIZE * h / w)
+        else:
+            new_w, new_h = int(CLIP_IMAGE_SIZE * w / h), CLIP_IMAGE_SIZE
+        patches = F.interpolate(patches, size=(new_h, new_w), mode="bicubic", align_corners=False, antialias=True)
+        top = int(round((new_h - CLIP_IMAGE_SIZE) / 2.0))
+        left = int(round((new_w - CLIP_IMAGE_SIZE) / 2.0))
+        batch[indices] = patches[:, :, top:top+CLIP_IMAGE_SIZE, left:left+CLIP_IMAGE_SIZE]
+
+    batch.clamp_(0, 1)
+    return batch.sub_(clip_mean).div_(clip_std)
+
+def generate_patch_embeddings(frame_path: str, model, preprocess, device) -> List[FramePatch]:
+    loaded = load_frame_tensors([frame_path], device)[0]
+    if loaded is None:
         raise ValueError(f"Could not load frame: {frame_path}")
     
-    height, width = frame.shape[:2]
-    patch_configs = generate_patch_configs(width, height)
+    frame_t, frame_size = loaded
+    patch_configs, crop_configs = frame_patch_configs(frame_t, frame_size)
+    
+    # all patches are preprocessed on device and go through the model in one batch
+    patch_batch = preprocess_frame_patches(frame_t, crop_configs, device)
+    features = encode_padded_batch(patch_batch)
     
     patches = []
-    for config in patch_configs:
-        try:
-            # extract patch region
-            x, y, w, h = config["x"], config["y"], config["width"], config["height"]
-            patch = frame[y:y+h, x:x+w]
-            
-            patch_rgb = cv2.cvtColor(patch, cv2.COLOR_BGR2RGB)
-            pil_patch = Image.fromarray(patch_rgb)
-            
-            # generate embedding
-            image_tensor = preprocess(pil_patch).unsqueeze(0).to(device)
-            with torch.no_grad():
-                image_features = model.encode_image(image_tensor)
-                embedding = image_features.cpu().numpy().flatten().tolist()
-            
-            patches.append(FramePatch(
-                patch_type=config["patch_type"],
-                x=x,
-                y=y,
-                width=w,
-                height=h,
-                embedding=embedding
-            ))
-            
-        except Exception as e:
-            logger.error(f"❌ Error processing patch {config['patch_type']}: {str(e)}")
-            continue
+    for config, embedding in zip(patch_configs, features):
+        patches.append(FramePatch(
+            patch_type=config["patch_type"],
+            x=config["x"],
+            y=config["y"],
+            width=config["width"],
+            height=config["height"],
+            embedding=embedding.tolist()
+        ))
     
     return patches
 
+async def run_inference(fn, *args):
+    """Run blocking model work on the inference thread and await its result."""
+    return await asyncio.get_running_loop().run_in_executor(inference_executor, fn, *args)
+
+def preprocess_full_image(image: np.ndarray) -> torch.Tensor:
+    """Preprocess a whole BGR image into a (1, 3, 224, 224) batch, same as indexed frames."""
+    height, width = image.shape[:2]
+    full_patch = {"patch_type": "full", "x": 0, "y": 0, "width": width, "height": height}
+    return preprocess_frame_patches(frame_to_tensor(image, device), [full_patch], device)
+
+def encode_padded_batch(image_batch: torch.Tensor) -> np.ndarray:
+    """
+    Encode a batch in chunks of at most EMBED_PATHS_MAX_BATCH, each padded up to the next power
+    of two when the encoder is compiled, so it only ever sees the batch sizes warmed up in
+    load_model instead of recompiling for each new one. Calls from other threads wait for
+    the encode to run on the inference thread.
+    """
+    if not getattr(inference_thread, "active", False):
+        return inference_executor.submit(encode_padded_batch, image_batch).result()
+    if len(image_batch) > EMBED_PATHS_MAX_BATCH:
+        return np.concatenate([encode_padded_batch(chunk) for chunk in torch.split(image_batch, EMBED_PATHS_MAX_BATCH)])
+    size = len(image_batch)
+    padded_size = 1 << (size - 1).bit_length() if visual_compiled else size
+    if padded_size > size:
+        padding = image_batch.new_zeros((padded_size - size, *image_batch.shape[1:]))
+        image_batch = torch.cat([image_batch, padding])
+    return encode_image_batch(image_batch, model, device)[:size]
+
+async def embedding_batcher():
+    """Encode queued /embed/single images in batches of up to EMBED_MAX_BATCH."""
+    loop = asyncio.get_running_loop()
+    while True:
+        items = [await embed_queue.get()]
+        deadline = loop.time() + EMBED_BATCH_WAIT_MS / 1000
+        while len(items) < EMBED_MAX_BATCH:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(embed_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        try:
+            features = await run_inference(encode_padded_batch, torch.cat([image_t for image_t, _ in items]))
+            for (_, future), embedding in zip(items, features):
+                if not future.done():
+                    future.set_result(embedding)
+        except Exception as e:
+            logger.error(f"❌ Error encoding batch of {len(items)} images: {str(e)}")
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+
+async def embed_batched(image_t: torch.Tensor) -> np.ndarray:
+    """Queue a preprocessed (1, 3, 224, 224) image for the batcher and await its embedding."""
+    global embed_queue, embed_batcher_task
+    loop = asyncio.get_running_loop()
+    # (re)start the batcher in the loop serving this request
+    if embed_batcher_task is None or embed_batcher_task.done() or embed_batcher_task.get_loop() is not loop:
+        embed_queue = asyncio.Queue()
+        embed_batcher_task = loop.create_task(embedding_batcher())
+    future = loop.create_future()
+    await embed_queue.put((image_t, future))
+    return await future
+
+# /embed/batch reads its files here; cv2 releases the GIL while decoding, so they load in parallel
+image_loader_pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1), thread_name_prefix="embed-batch")
+
+def load_image_path(image_path: str) -> Optional[np.ndarray]:
+    """Decode an image file as BGR, logging and returning None for missing or corrupt files."""
+    if not os.path.exists(image_path):
+        logger.warning(f"⚠️  Image file not found: {image_path}")
+        return None
+    image = cv2.imread(image_path)
+    if image is None:
+        logger.error(f"❌ Error processing {image_path}: Could not load image")
+    return image
+
+def embed_image_paths(image_paths: List[str]) -> List[Dict[str, Any]]:
+    """
+    Embed each readable image in `image_paths`, skipping missing or corrupt files. Loading and
+    preprocessing run on the calling thread and image_loader_pool; only the forward passes go
+    to the inference thread.
+    """
+    images = list(image_loader_pool.map(load_image_path, image_paths))
+    loaded = [(image_path, image) for image_path, image in zip(image_paths, images) if image is not None]
+
+    # one padded forward pass per EMBED_PATHS_MAX_BATCH images instead of one per image
+    embeddings = []
+    for start in range(0, len(loaded), EMBED_PATHS_MAX_BATCH):
+        chunk = loaded[start:start + EMBED_PATHS_MAX_BATCH]
+        features = encode_padded_batch(torch.cat([preprocess_full_image(image) for _, image in chunk]))
+        for (image_path, _), embedding in zip(chunk, features):
+            embeddings.append({
+                "path": image_path,
+                "embedding": embedding.tolist(),
+                "dimensions": len(embedding),
+                "filename": os.path.basename(image_path)
+            })
+    logger.info(f"✅ Generated {len(embeddings)}/{len(image_paths)} batch embeddings")
+    return embeddings
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
-    return {
-        "status": "healthy",
-        "model_loaded": model is not None,
-        "device": str(device) if device else None
-    }
+    return health_response(model is not None, device)
 
 @app.post("/embed/single", response_model=Dict[str, Any])
 async def generate_single_embedding(file: UploadFile = File(...)):
@@ -326,22 +958,16 @@ async def generate_single_embedding(file: UploadFile = File(...)):
         logger.info(f"Received file: {file.filename}, content_type: {file.content_type}")
         contents = await file.read()
         logger.info(f"File size: {len(contents)} bytes")
-        from PIL import Image
-        import io
-        try:
-            image = Image.open(io.BytesIO(contents)).convert('RGB')
-            logger.info(f"Image loaded: {image.size}")
-        except Exception as e:
-            logger.error(f"Failed to load image: {str(e)}")
+        # decode with OpenCV so the screenshot goes through the same preprocess as indexed frames
+        image = await run_in_threadpool(cv2.imdecode, np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            logger.error("Failed to load image: unsupported or corrupt image data")
             return {"embeddings": []}
+        logger.info(f"Image loaded: {image.shape[1]}x{image.shape[0]}")
 
-        width, height = image.size
-        full_patch = {"patch_type": "full", "x": 0, "y": 0, "width": width, "height": height}
-        patch = image.crop((full_patch["x"], full_patch["y"], full_patch["x"]+full_patch["width"], full_patch["y"]+full_patch["height"]))
-        image_tensor = preprocess(patch).unsqueeze(0).to(device)
-        with torch.no_grad():
-            image_features = model.encode_image(image_tensor)
-            embedding = image_features.cpu().numpy().flatten().tolist()
+        height, width = image.shape[:2]
+        image_t = await run_in_threadpool(preprocess_full_image, image)
+        embedding = (await embed_batched(image_t)).tolist()
         embeddings = [{
             "patch_type": "full",
             "embedding": embedding,
@@ -350,7 +976,7 @@ async def generate_single_embedding(file: UploadFile = File(...)):
             "width": width,
             "height": height
         }]
-        logger.info(f"Returning 1 full-image patch embedding for screenshot")
+        logger.info("Returning 1 full-image patch embedding for screenshot")
         return {"embeddings": embeddings}
 
     except Exception as e:
@@ -367,27 +993,7 @@ async def generate_batch_embeddings(request: EmbeddingRequest):
         List of embeddings with metadata
     """
     try:
-        embeddings = []
-        for image_path in request.image_paths:
-            try:
-                if not os.path.exists(image_path):
-                    logger.warning(f"⚠️  Image file not found: {image_path}")
-                    continue
-                image = Image.open(image_path).convert('RGB')
-                image_tensor = preprocess(image).unsqueeze(0).to(device)
-                with torch.no_grad():
-                    image_features = model.encode_image(image_tensor)
-                    embedding = image_features.cpu().numpy().flatten().tolist()
-                embeddings.append({
-                    "path": image_path,
-                    "embedding": embedding,
-                    "dimensions": len(embedding),
-                    "filename": os.path.basename(image_path)
-                })
-                logger.info(f"✅ Generated embedding for: {os.path.basename(image_path)}")
-            except Exception as e:
-                logger.error(f"❌ Error processing {image_path}: {str(e)}")
-                continue
+        embeddings = await run_in_threadpool(embed_image_paths, request.image_paths)
         return EmbeddingResponse(
             embeddings=embeddings,
             model_info={
@@ -446,25 +1052,25 @@ async def process_video(request: VideoProcessingRequest):
 @app.post("/start-process-video")
 async def start_process_video(request: VideoProcessingRequest, background_tasks: BackgroundTasks):
     job_id = str(uuid.uuid4())
-    with job_status_lock:
-        job_status[job_id] = {"status": "pending", "progress": 0, "total": 0, "error": None}
+    job_status[job_id] = JobState()
     background_tasks.add_task(process_video_job, request, job_id)
     return {"job_id": job_id, "status": "started"}
 
 @app.get("/status/{job_id}")
 async def get_status(job_id: str):
-    with job_status_lock:
-        return job_status.get(job_id, {"status": "unknown"})
+    state = job_status.get(job_id)
+    return state.as_dict() if state is not None else {"status": "unknown"}
 
 @app.get("/jobs")
 async def list_jobs():
-    with job_status_lock:
-        return [
-            {"job_id": job_id, **status}
-            for job_id, status in job_status.items()
-        ]
+    return [
+        {"job_id": job_id, **state.as_dict()}
+        # snapshot the items so a job started mid-iteration can't resize the dict under us
+        for job_id, state in list(job_status.items())
+    ]
 
 def process_video_job(request, job_id):
+    state = job_status[job_id]
     try:
         logger.info(f"[Job {job_id}] Starting video processing: {request.video_path}")
 
@@ -488,60 +1094,103 @@ def process_video_job(request, job_id):
                 }
                 for idx, frame_path in enumerate(frame_files)
             ]
+            total_frames = len(extracted_frames)
+            frame_stream = iter(extracted_frames)
         else:
-            extracted_frames = extract_frames_from_video(
+            # decode straight into memory (TorchCodec, else the ffmpeg pipe) instead of reading JPEGs back
+            try:
+                total_frames = math.ceil(probe_video_stream(request.video_path)['nb_frames'] / request.frame_interval)
+            except Exception as e:
+                logger.warning(f"[Job {job_id}] Could not estimate frame count: {str(e)}")
+                total_frames = 0
+            frame_stream = stream_every_nth_frame(
                 request.video_path,
                 request.output_dir,
                 request.frame_interval
             )
 
-        total_frames = len(extracted_frames)
-        with job_status_lock:
-            job_status[job_id]["status"] = "processing"
-            job_status[job_id]["total"] = total_frames
-            job_status[job_id]["progress"] = 0
+        state.total = total_frames
+        state.progress = 0
+        state.status = "processing"
+
+        # check ChromaDB once for every vector ID this job will write
+        movie_title_safe = movie_title.replace(' ', '_')
+        patch_types = [config["patch_type"] for config in generate_patch_configs(2, 2)]
+        if frame_files:
+            job_timestamps = [f["timestamp"] for f in extracted_frames]
+        else:
+            job_timestamps = range(1, total_frames + 1)
+        # lossy and only shrinks the upsert payload, so off unless asked for; int8-level
+        # embeddings rank identically only under cosine distance
+        quantize = (
+            collection is not None
+            and os.getenv("CHROMA_QUANTIZE_EMBEDDINGS", "0") == "1"
+            and collection_space(collection) == "cosine"
+        )
+        # inner-product collections expect unit vectors so 1 - dot stays a cosine distance
+        normalize = collection is not None and collection_space(collection) == "ip"
+        existing_ids = set()
+        if collection is not None and total_frames:
+            all_ids = [
+                f"{movie_title_safe}_{timestamp:06d}_{patch_type}"
+                for timestamp in job_timestamps
+                for patch_type in patch_types
+            ]
+            try:
+                existing_ids = set(collection.get(ids=all_ids, include=[])["ids"])
+                logger.info(f"[Job {job_id}] {len(existing_ids)}/{len(all_ids)} patch embeddings already in ChromaDB")
+            except Exception as e:
+                logger.error(f"[Job {job_id}] Error checking existing embeddings: {str(e)}")
 
         BATCH_SIZE = 20
-        batches = [extracted_frames[i:i+BATCH_SIZE] for i in range(0, total_frames, BATCH_SIZE)]
-        for batch_idx, batch in enumerate(batches):
-            logger.info(f"[Job {job_id}] Embedding batch {batch_idx+1}/{len(batches)} (size {len(batch)})...")
+        total_batches = math.ceil(total_frames / BATCH_SIZE)
+
+        def decode_batches():
+            # decode stage: read the next batch of frames and upload them while the previous batch is encoded
+            for batch in iter(lambda: list(itertools.islice(frame_stream, BATCH_SIZE)), []):
+                # skip frames whose patches are all embedded already
+                pending = [
+                    i for i, f in enumerate(batch)
+                    if not all(f"{movie_title_safe}_{f['timestamp']:06d}_{patch_type}" in existing_ids for patch_type in patch_types)
+                ]
+                disk_pending = [i for i in pending if batch[i].get("frame") is None and batch[i].get("frame_t") is None]
+                loaded_frames = dict(zip(disk_pending, load_frame_tensors([batch[i]["path"] for i in disk_pending], device)))
+                for i in pending:
+                    if i in loaded_frames:
+                        continue
+                    if batch[i].get("frame_t") is not None:
+                        # TorchCodec frames are already RGB tensors, usually on the GPU
+                        frame_t = batch[i]["frame_t"].to(device, non_blocking=True)
+                        loaded_frames[i] = (frame_t, (frame_t.shape[2], frame_t.shape[1]))
+                    else:
+                        frame = batch[i]["frame"]
+                        loaded_frames[i] = (frame_to_tensor(frame, device), (frame.shape[1], frame.shape[0]))
+                yield batch, pending, loaded_frames
+
+        # decode -> preprocess/encode (this thread) -> upsert (upsert worker) all run concurrently
+        for batch_idx, (batch, pending, loaded_frames) in enumerate(prefetch(decode_batches(), depth=2, name=f"decode-{job_id[:8]}")):
+            logger.info(f"[Job {job_id}] Embedding batch {batch_idx+1}/{total_batches} (size {len(batch)})...")
             paths = [f["path"] for f in batch]
             timestamps = [f["timestamp"] for f in batch]
-            # check ChromaDB for already-embedded frames
-            existing = set()
-            if collection is not None:
-                try:
-                    existing_ids = set(collection.get(ids=paths)["ids"])
-                    existing = set(existing_ids)
-                except Exception as e:
-                    logger.error(f"[Job {job_id}] Error checking existing embeddings: {str(e)}")
             patch_vector_ids = []
-            patch_embeddings = []
+            patch_batches = []
             patch_metadatas = []
-            for i, frame_path in enumerate(paths):
-                if frame_path in existing:
-                    continue 
+            created_at = datetime.utcnow().isoformat()
+            for i in pending:
+                frame_path = paths[i]
+                loaded = loaded_frames[i]
                 try:
-                    # generate patch embeddings
-                    frame = cv2.imread(frame_path)
-                    if frame is not None:
-                        height, width = frame.shape[:2]
-                        patch_configs = generate_patch_configs(width, height)
+                    # preprocess patches; the whole batch is encoded in one forward pass below
+                    if loaded is not None:
+                        frame_t, frame_size = loaded
+                        patch_configs, crop_configs = frame_patch_configs(frame_t, frame_size)
+                        patch_batches.append(preprocess_frame_patches(frame_t, crop_configs, device))
                         for config in patch_configs:
                             x, y, w, h = config["x"], config["y"], config["width"], config["height"]
                             patch_type = config["patch_type"]
-                            patch = frame[y:y+h, x:x+w]
-                            patch_rgb = cv2.cvtColor(patch, cv2.COLOR_BGR2RGB)
-                            pil_patch = Image.fromarray(patch_rgb)
-                            patch_tensor = preprocess(pil_patch).unsqueeze(0).to(device)
-                            with torch.no_grad():
-                                patch_features = model.encode_image(patch_tensor)
-                                patch_embedding = patch_features.cpu().numpy().flatten().tolist()
                             # deterministic vector ID: {movieTitle}_{timestamp}_{patchType}
-                            movie_title_safe = movie_title.replace(' ', '_')
                             vector_id = f"{movie_title_safe}_{timestamps[i]:06d}_{patch_type}"
                             patch_vector_ids.append(vector_id)
-                            patch_embeddings.append(patch_embedding)
                             patch_metadatas.append({
                                 "framePath": frame_path,
                                 "timestamp": timestamps[i],
@@ -553,31 +1202,44 @@ def process_video_job(request, job_id):
                                 "y": y,
                                 "width": w,
                                 "height": h,
-                                "createdAt": datetime.utcnow().isoformat()
+                                "createdAt": created_at
                             })
                 except Exception as e:
                     logger.error(f"[Job {job_id}] Error loading {frame_path}: {str(e)}")
-            # upsert all patch embeddings in this batch
-            if patch_vector_ids:
+            patch_embeddings = None
+            if patch_batches:
                 try:
-                    collection.upsert(
-                        ids=patch_vector_ids,
-                        embeddings=patch_embeddings,
-                        metadatas=patch_metadatas
-                    )
+                    # ChromaDB takes the float32 array as-is; no need to box 512 Python floats per patch
+                    patch_embeddings = np.asarray(encode_padded_batch(torch.cat(patch_batches)), dtype=np.float32)
+                    if quantize:
+                        patch_embeddings = quantize_embeddings(patch_embeddings)
+                    elif normalize:
+                        patch_embeddings = normalize_embeddings(patch_embeddings)
                 except Exception as e:
-                    logger.error(f"[Job {job_id}] Error upserting patch batch to ChromaDB: {str(e)}")
-            logger.info(f"[Job {job_id}] Finished batch {batch_idx+1}/{len(batches)}")
-            with job_status_lock:
-                job_status[job_id]["progress"] += len(batch)
-        with job_status_lock:
-            job_status[job_id]["status"] = "done"
+                    logger.error(f"[Job {job_id}] Error encoding patch batch: {str(e)}")
+                    patch_vector_ids = []
+            # hand all patch embeddings in this batch to the upsert worker and move on to the next batch
+            if patch_vector_ids:
+                upsert_queue.put({
+                    "job_id": job_id,
+                    "upsert": {
+                        "ids": patch_vector_ids,
+                        "embeddings": patch_embeddings,
+                        "metadatas": patch_metadatas
+                    }
+                })
+            logger.info(f"[Job {job_id}] Finished batch {batch_idx+1}/{total_batches}")
+            state.progress += len(batch)
+        flushed = Event()
+        upsert_queue.put(flushed)
+        flushed.wait()
+        state.total = state.progress
+        state.status = "done"
         logger.info(f"[Job {job_id}] Video processing complete.")
     except Exception as e:
         logger.error(f"[Job {job_id}] Error: {str(e)}")
-        with job_status_lock:
-            job_status[job_id]["status"] = "error"
-            job_status[job_id]["error"] = str(e)
+        state.error = str(e)
+        state.status = "error"
 
 # ChromaDB Vector Database Endpoints
 
@@ -605,12 +1267,17 @@ async def upsert_vectors(request: dict):
         ids = [v["id"] for v in vectors]
         embeddings = [v["embedding"] for v in vectors]
         metadatas = [v["metadata"] for v in vectors]
+        if collection_space(collection) == "ip":
+            embeddings = normalize_embeddings(embeddings)
         
-        collection.upsert(
+        # ChromaDB calls block, so run them in the threadpool and keep the event loop serving requests
+        await run_in_threadpool(
+            collection.upsert,
             ids=ids,
             embeddings=embeddings,
             metadatas=metadatas
         )
+        vector_count_cache["value"] = None
         
         logger.info(f"✅ Upserted {len(vectors)} vectors to ChromaDB")
         return {"status": "success", "count": len(vectors)}
@@ -621,7 +1288,11 @@ async def upsert_vectors(request: dict):
 
 @app.post("/vector-db/query")
 async def query_vectors(request: dict):
-    """Query similar vectors. Always return top N most similar vectors, where N is the 'limit' in the request (default 10)."""
+    """
+    Query similar vectors. Always return top N most similar vectors, where N is the 'limit' in the request (default 10).
+    `score` is the collection's distance: 1 - cosine similarity for cosine, 1 - dot for inner product
+    (the same value, since the query and stored vectors are unit length there).
+    """
     if collection is None:
         logger.error("ChromaDB collection is not initialized. Cannot query vectors.")
         return {"error": "ChromaDB collection not initialized"}
@@ -630,8 +1301,11 @@ async def query_vectors(request: dict):
         limit = request.get("limit", 10)
         if not embedding:
             raise HTTPException(status_code=400, detail="No embedding provided")
+        if collection_space(collection) == "ip":
+            embedding = normalize_embeddings([embedding])[0]
 
-        results = collection.query(
+        results = await run_in_threadpool(
+            collection.query,
             query_embeddings=[embedding],
             n_results=limit
         )
@@ -654,27 +1328,43 @@ async def query_vectors(request: dict):
 
 @app.delete("/vector-db/delete")
 async def delete_vectors(request: dict):
-    """Delete vectors by frame ID."""
+    """
+    Delete the vectors of one frame ("frameId") or several ("frameIds") with one metadata filter,
+    which also catches vectors written before a restart or by another worker. Vector IDs passed
+    in "ids" are deleted as well.
+    """
     if collection is None:
         logger.error("ChromaDB collection is not initialized. Cannot delete vectors.")
         return {"error": "ChromaDB collection not initialized"}
     try:
         
         frame_id = request.get("frameId")
-        if not frame_id:
+        frame_ids = request.get("frameIds") or ([frame_id] if frame_id else [])
+        if not frame_ids:
             raise HTTPException(status_code=400, detail="No frame ID provided")
         
-        collection.delete(
-            where={"frameId": frame_id}
+        ids = request.get("ids")
+        if ids:
+            await run_in_threadpool(collection.delete, ids=list(ids))
+        await run_in_threadpool(
+            collection.delete,
+            where={"frameId": {"$in": frame_ids}}
         )
+        vector_count_cache["value"] = None
         
-        logger.info(f"✅ Deleted vectors for frame {frame_id}")
-        return {"status": "success", "message": f"Deleted vectors for frame {frame_id}"}
+        deleted = f"frame {frame_ids[0]}" if len(frame_ids) == 1 else f"{len(frame_ids)} frames"
+        logger.info(f"✅ Deleted vectors for {deleted}")
+        return {"status": "success", "message": f"Deleted vectors for {deleted}"}
         
     except Exception as e:
         logger.error(f"❌ Error deleting vectors: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to delete vectors: {str(e)}")
 
+# /vector-db/stats is polled by dashboards, so collection.count() is refreshed at most
+# every VECTOR_COUNT_TTL_S seconds; upserts and deletes through this API invalidate it
+VECTOR_COUNT_TTL_S = float(os.getenv("VECTOR_COUNT_TTL_S", "2"))
+vector_count_cache = {"value": None, "ts": 0.0}
+
 @app.get("/vector-db/stats")
 async def get_db_stats():
     """Get database statistics."""
@@ -683,7 +1373,9 @@ async def get_db_stats():
         return {"error": "ChromaDB collection not initialized"}
     try:
         
-        count = collection.count()
+        if vector_count_cache["value"] is None or time.monotonic() - vector_count_cache["ts"] >= VECTOR_COUNT_TTL_S:
+            vector_count_cache.update(value=await run_in_threadpool(collection.count), ts=time.monotonic())
+        count = vector_count_cache["value"]
         
         return {
             "total_vectors": count,
@@ -695,17 +1387,46 @@ async def get_db_stats():
         logger.error(f"❌ Error getting database stats: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get database stats: {str(e)}")
 
+# little-endian numpy dtypes for ?format=bin responses
+BINARY_EMBEDDING_DTYPES = {"f32": "<f4", "f16": "<f2"}
+
+def load_debug_image(frame_path: str) -> torch.Tensor:
+    """Decode and CLIP-preprocess an image file, returning it as a (1, 3, 224, 224) tensor on `device`."""
+    if device.type == "cuda":
+        # nvJPEG decode plus resize/crop/normalize on the GPU: only the compressed file crosses PCIe
+        loaded = load_frame_tensors([frame_path], device)[0]
+        if loaded is not None:
+            frame_t, _ = loaded
+            height, width = frame_t.shape[1:]
+            full_patch = {"patch_type": "full", "x": 0, "y": 0, "width": width, "height": height}
+            return preprocess_frame_patches(frame_t, [full_patch], device)
+    image = Image.open(frame_path)
+    # preprocess shrinks the short side to 224 anyway, so let libjpeg decode JPEGs at the
+    # smallest 1/2..1/8 scale that keeps both sides >= 224 (a no-op for other formats)
+    image.draft("RGB", (CLIP_IMAGE_SIZE, CLIP_IMAGE_SIZE))
+    # convert() copies the whole pixel buffer even when the mode already matches
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return tensor_to_device(preprocess(image).unsqueeze(0), device)
+
 @app.get("/debug/embedding/{frame_path:path}")
-async def debug_embedding(frame_path: str):
-    """Debug endpoint: print the embedding for a given image path."""
+async def debug_embedding(frame_path: str, response_format: str = Query("json", alias="format"), dtype: Literal["f32", "f16"] = "f32"):
+    """
+    Debug endpoint: print the embedding for a given image path.
+    With ?format=bin the embedding is returned as raw little-endian float32 bytes, or float16
+    with &dtype=f16, skipping the per-float list conversion.
+    """
     try:
-        image = Image.open(frame_path).convert('RGB')
-        image_tensor = preprocess(image).unsqueeze(0).to(device)
-        with torch.no_grad():
-            image_features = model.encode_image(image_tensor)
-            embedding = image_features.cpu().numpy().flatten().tolist()
-        logger.info(f"[DEBUG] Embedding for {frame_path}: {embedding}")
-        return JSONResponse({"embedding": embedding})
+        # decode off the event loop, then share a forward pass with concurrent requests
+        image_t = await run_in_threadpool(load_debug_image, frame_path)
+        embedding = await embed_batched(image_t)
+        # the vector itself is in the response; the log only gets a summary, and only at DEBUG
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[DEBUG] Embedding for %s: %d floats, norm %.4f", frame_path, embedding.shape[0], float(np.linalg.norm(embedding)))
+        if response_format == "bin":
+            return Response(content=embedding.astype(BINARY_EMBEDDING_DTYPES[dtype]).tobytes(), media_type="application/octet-stream")
+        # orjson writes the float32 array directly, without building a list of Python floats
+        return ORJSONResponse({"embedding": embedding})
     except Exception as e:
         logger.error(f"[DEBUG] Error embedding {frame_path}: {str(e)}")
-        return JSONResponse({"error": str(e)}, status_code=500)
+        return ORJSONResponse({"error": str(e)}, status_code=500)